@@ -0,0 +1,29 @@
+"""add user image sizes
+
+Revision ID: 5e2a9f0c1b73
+Revises: d4e8b21c7f90
+Create Date: 2026-10-17 14:22:41.093117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2a9f0c1b73'
+down_revision: Union[str, Sequence[str], None] = 'd4e8b21c7f90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing pictures stay single-file uploads (NULL sizes) and keep working
+    op.add_column('users', sa.Column('image_sizes', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'image_sizes')
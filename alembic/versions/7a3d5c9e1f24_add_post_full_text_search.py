@@ -0,0 +1,69 @@
+"""add post full text search
+
+Revision ID: 7a3d5c9e1f24
+Revises: 5e2a9f0c1b73
+Create Date: 2026-10-17 16:40:12.508331
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3d5c9e1f24'
+down_revision: Union[str, Sequence[str], None] = '5e2a9f0c1b73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        # Adding a STORED generated column rewrites the table once
+        op.execute(
+            "ALTER TABLE posts ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', title), 'A') || "
+            "setweight(to_tsvector('english', content), 'B')) STORED"
+        )
+        with op.get_context().autocommit_block():
+            op.execute(
+                'CREATE INDEX CONCURRENTLY ix_posts_search_vector '
+                'ON posts USING gin (search_vector)'
+            )
+    else:
+        op.execute(
+            "CREATE VIRTUAL TABLE posts_fts USING fts5("
+            "title, content, content='posts', content_rowid='id', "
+            "tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN "
+            "INSERT INTO posts_fts (rowid, title, content) "
+            "VALUES (new.id, new.title, new.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN "
+            "INSERT INTO posts_fts (posts_fts, rowid, title, content) "
+            "VALUES ('delete', old.id, old.title, old.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER posts_fts_update AFTER UPDATE OF title, content ON posts BEGIN "
+            "INSERT INTO posts_fts (posts_fts, rowid, title, content) "
+            "VALUES ('delete', old.id, old.title, old.content); "
+            "INSERT INTO posts_fts (rowid, title, content) "
+            "VALUES (new.id, new.title, new.content); END"
+        )
+        # Index the posts that already exist
+        op.execute("INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_posts_search_vector', table_name='posts')
+        op.drop_column('posts', 'search_vector')
+    else:
+        for trigger in ('posts_fts_insert', 'posts_fts_delete', 'posts_fts_update'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS posts_fts')
@@ -0,0 +1,49 @@
+"""add feed and lower case indexes
+
+Revision ID: 9c1f3a7d2e6b
+Revises: 4b24ef338e6f
+Create Date: 2026-10-17 09:12:44.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1f3a7d2e6b'
+down_revision: Union[str, Sequence[str], None] = '4b24ef338e6f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_indexes(**kw) -> None:
+    op.create_index('ix_users_username_lower', 'users', [sa.text('lower(username)')], unique=False, **kw)
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=False, **kw)
+    op.create_index('ix_posts_date_posted', 'posts', [sa.text('date_posted DESC')], unique=False, **kw)
+    op.create_index('ix_posts_user_id_date_posted', 'posts', ['user_id', sa.text('date_posted DESC')], unique=False, **kw)
+    # The composite index covers every user_id lookup the old index served
+    op.drop_index(op.f('ix_posts_user_id'), table_name='posts', **kw)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        # Build without locking the tables against writes; CONCURRENTLY
+        # cannot run inside a transaction.
+        with op.get_context().autocommit_block():
+            _create_indexes(postgresql_concurrently=True)
+    else:
+        # SQLite (3.9+) supports expression and DESC indexes with plain
+        # CREATE INDEX inside the migration transaction.
+        _create_indexes()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_posts_user_id'), 'posts', ['user_id'], unique=False)
+    op.drop_index('ix_posts_user_id_date_posted', table_name='posts')
+    op.drop_index('ix_posts_date_posted', table_name='posts')
+    op.drop_index('ix_users_email_lower', table_name='users')
+    op.drop_index('ix_users_username_lower', table_name='users')
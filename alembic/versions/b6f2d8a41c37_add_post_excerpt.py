@@ -0,0 +1,78 @@
+"""add post excerpt
+
+Revision ID: b6f2d8a41c37
+Revises: 7a3d5c9e1f24
+Create Date: 2026-10-17 18:05:29.614870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6f2d8a41c37'
+down_revision: Union[str, Sequence[str], None] = '7a3d5c9e1f24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EXCERPT_LENGTH = 200
+BACKFILL_BATCH_SIZE = 1000
+
+posts = sa.table(
+    'posts',
+    sa.column('id', sa.Integer()),
+    sa.column('content', sa.Text()),
+    sa.column('excerpt', sa.String()),
+)
+
+
+def _excerpt(content: str) -> str:
+    # models.make_excerpt as of this revision
+    text = ' '.join(content.split())
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text[:EXCERPT_LENGTH]
+    if text[EXCERPT_LENGTH] != ' ' and ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip(' .,;:!?-') + '…'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('excerpt', sa.String(length=EXCERPT_LENGTH + 1), nullable=True))
+
+    # Backfill in id order, a batch at a time, so no statement holds the
+    # whole table's content in memory.
+    bind = op.get_bind()
+    set_excerpt = (
+        posts.update()
+        .where(posts.c.id == sa.bindparam('post_id'))
+        .values(excerpt=sa.bindparam('new_excerpt'))
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(posts.c.id, posts.c.content)
+            .where(posts.c.id > last_id)
+            .order_by(posts.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            set_excerpt,
+            [{'post_id': row.id, 'new_excerpt': _excerpt(row.content)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    # As with updated_at, SQLite keeps the column nullable rather than
+    # rebuilding the table; the model always supplies a value.
+    if bind.dialect.name != 'sqlite':
+        op.alter_column('posts', 'excerpt', nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('posts', 'excerpt')
@@ -0,0 +1,43 @@
+"""add row version and updated_at
+
+Revision ID: d4e8b21c7f90
+Revises: 9c1f3a7d2e6b
+Create Date: 2026-10-17 11:03:17.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e8b21c7f90'
+down_revision: Union[str, Sequence[str], None] = '9c1f3a7d2e6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('users', 'posts'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        # SQLite cannot ADD COLUMN with a CURRENT_TIMESTAMP default, so add it
+        # nullable and backfill; the model supplies the value on insert/update.
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.execute('UPDATE users SET updated_at = CURRENT_TIMESTAMP')
+    op.execute('UPDATE posts SET updated_at = date_posted')
+
+    if op.get_bind().dialect.name != 'sqlite':
+        for table in ('users', 'posts'):
+            op.alter_column(table, 'updated_at', nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Plain DROP COLUMN (SQLite 3.35+); batch mode would rebuild the tables
+    # and lose the lower() expression indexes.
+    for table in ('posts', 'users'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+
+import brotli
+from fastapi.responses import FileResponse, Response
+from fastapi.staticfiles import StaticFiles
+from jinja2 import pass_context
+from starlette.datastructures import Headers
+from starlette.types import Scope
+
+STATIC_DIR = Path("static")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Binary formats that are already compressed are served as they are
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "image/svg+xml",
+    "image/vnd.microsoft.icon",
+    "image/x-icon",
+)
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+## Accept-Encoding Negotiation
+def accepted_encodings(header: str) -> set[str]:
+    """Content codings the client accepts, ignoring those with q=0."""
+    accepted = set()
+    for part in header.split(","):
+        coding, *params = part.split(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+## Fingerprinted Asset
+class Asset:
+    def __init__(self, path: Path, digest: str, media_type: str, encoded: dict[str, bytes]):
+        self.path = path
+        self.digest = digest
+        self.media_type = media_type
+        self.encoded = encoded  # smallest first, e.g. {"br": ..., "gzip": ...}
+
+    def response(self, request_headers: Headers) -> Response:
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next(
+            (coding for coding in self.encoded if coding in accepted or "*" in accepted),
+            None,
+        )
+
+        etag = f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": etag}
+        if self.encoded:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag in request_headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(self.encoded[encoding], media_type=self.media_type, headers=headers)
+        return FileResponse(self.path, media_type=self.media_type, headers=headers)
+
+
+## Asset Manifest
+class AssetManifest:
+    """Content-hashed names for every file under a static directory.
+
+    ``css/main.css`` is published as ``css/main.<hash>.css``, so the URL
+    changes whenever the file does and can be cached forever. Text assets
+    are compressed once here, at startup, rather than on every request.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.hashed_names: dict[str, str] = {}
+        self.assets: dict[str, Asset] = {}
+        self.build()
+
+    def build(self) -> None:
+        hashed_names = {}
+        assets = {}
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            data = path.read_bytes()
+            digest = hashlib.blake2b(data, digest_size=5).hexdigest()
+            name = path.relative_to(self.directory).as_posix()
+            hashed = f"{name[: -len(path.suffix)] if path.suffix else name}.{digest}{path.suffix}"
+
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            encoded = {}
+            if media_type.startswith(COMPRESSIBLE_TYPES):
+                encoded["br"] = brotli.compress(data, quality=11)
+                encoded["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+                # Tiny files can grow when compressed
+                encoded = {
+                    coding: body for coding, body in encoded.items()
+                    if len(body) < len(data)
+                }
+
+            hashed_names[name] = hashed
+            assets[hashed] = Asset(path, digest, media_type, encoded)
+        self.hashed_names = hashed_names
+        self.assets = assets
+
+    def hashed(self, name: str) -> str:
+        """Fingerprinted name, or the name itself for files added since startup."""
+        return self.hashed_names.get(name, name)
+
+
+asset_manifest = AssetManifest(STATIC_DIR)
+
+
+@pass_context
+def asset_url(context, name: str):
+    """Template helper: ``{{ asset_url('css/main.css') }}``."""
+    return context["request"].url_for("static", path=asset_manifest.hashed(name))
+
+
+## Static File Apps
+class AssetStaticFiles(StaticFiles):
+    """Serves fingerprinted names from the manifest, with precompressed bodies
+    and immutable caching. Plain names still work and are revalidated as usual.
+    """
+
+    def __init__(self, *, manifest: AssetManifest, **kwargs):
+        super().__init__(directory=manifest.directory, **kwargs)
+        self.manifest = manifest
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset = self.manifest.assets.get(Path(path).as_posix())
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+        return asset.response(Headers(scope=scope))
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """For files that are never rewritten in place, such as uploads saved
+    under a fresh random name.
+    """
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -1,3 +1,6 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime, timedelta
 import jwt
 from fastapi import Depends, HTTPException, status
@@ -5,10 +8,13 @@ from fastapi.security import OAuth2PasswordBearer
 from pwdlib import PasswordHash
 from typing import Annotated
 import models
+from metrics import password_hash_duration
+from cache import TTLCache
 from config import settings
 from database import get_db
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
 password_hash = PasswordHash.recommended()
 
@@ -22,6 +28,93 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return password_hash.verify(plain_password, hashed_password)
 
 
+## Password Hashing Pool
+class PasswordHashPool:
+    """Run argon2 hashing off the event loop on a small, bounded thread pool.
+
+    argon2 releases the GIL while it works, so threads give real parallelism.
+    Calls beyond ``max_workers + max_queue`` are rejected with 503 instead of
+    piling up behind a login storm.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, retry_after_seconds: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after_seconds = retry_after_seconds
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="argon2",
+        )
+        # Only touched from the event loop thread, so no lock is needed
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def _release(self) -> None:
+        self._pending -= 1
+
+    async def run(self, func, *args):
+        if self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy. Please try again shortly.",
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
+
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        started = time.perf_counter()
+        future = self._executor.submit(func, *args)
+        # The slot is freed when the hash finishes, not when the caller stops
+        # waiting: a cancelled login's hash still occupies its thread.
+        future.add_done_callback(lambda _: _call_soon(loop, self._release))
+        try:
+            result = await asyncio.wrap_future(future)
+        except Exception:
+            self.failed += 1
+            raise
+
+        elapsed = time.perf_counter() - started
+        self.completed += 1
+        self.total_seconds += elapsed
+        password_hash_duration.observe(elapsed)
+        return result
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage for monitoring."""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self._pending, self.max_workers),
+            "queued": max(self._pending - self.max_workers, 0),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "total_seconds": self.total_seconds,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback) -> None:
+    # From an executor thread; the loop may already be gone at shutdown
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        pass
+
+
+password_pool = PasswordHashPool(
+    max_workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_max_queue,
+    retry_after_seconds=settings.password_hash_retry_after_seconds,
+)
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -40,10 +133,10 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     return encoded_jwt
 
 
-def verify_access_token(token: str) -> str | None:
-    """Verify a JWT access token and return the subject (user id) if valid."""
+def decode_access_token(token: str) -> dict | None:
+    """Decode and verify a JWT access token, returning its claims if valid."""
     try:
-        payload = jwt.decode(
+        return jwt.decode(
             token,
             settings.secret_key.get_secret_value(),
             algorithms=[settings.algorithm],
@@ -51,42 +144,96 @@ def verify_access_token(token: str) -> str | None:
         )
     except jwt.InvalidTokenError:
         return None
-    else:
-        return payload.get("sub")
-    
 
-## get_current_user
-async def get_current_user(
-    token: Annotated[str, Depends(oauth2_scheme)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-                                ) -> models.User:
-    user_id = verify_access_token(token)
-    if user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
 
+def verify_access_token(token: str) -> str | None:
+    """Verify a JWT access token and return the subject (user id) if valid."""
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    return payload.get("sub")
+
+
+## Authenticated User Cache
+# token -> user id, kept no longer than the token itself is valid
+token_cache = TTLCache(
+    maxsize=settings.auth_cache_max_entries,
+    ttl_seconds=settings.auth_cache_ttl_seconds,
+)
+# user id -> column values of the users row
+user_cache = TTLCache(
+    maxsize=settings.auth_cache_max_entries,
+    ttl_seconds=settings.auth_cache_ttl_seconds,
+)
+
+CREDENTIALS_EXCEPTION_HEADERS = {"WWW-Authenticate": "Bearer"}
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop a cached user row. Call after any write to that user."""
+    user_cache.delete(user_id)
+
+
+def _user_id_from_token(token: str) -> int:
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    payload = decode_access_token(token)
     try:
-        user_id_int = int(user_id)
-    except (TypeError, ValueError):
+        user_id = int(payload["sub"])
+    except (TypeError, KeyError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
-            headers={"WWW-Authenticate": "Bearer"},
+            headers=CREDENTIALS_EXCEPTION_HEADERS,
         )
 
+    seconds_left = payload["exp"] - datetime.now(UTC).timestamp()
+    token_cache.set(
+        token,
+        user_id,
+        ttl_seconds=min(seconds_left, settings.auth_cache_ttl_seconds),
+    )
+    return user_id
+
+
+def _attach_cached_user(db: AsyncSession, values: dict) -> models.User:
+    # Build a fresh instance per request and attach it to this request's
+    # session as an already-persistent row. Other workers' writes do not
+    # invalidate this cache, so it is only good for reads; write endpoints
+    # re-load the row with populate_existing before acting on its columns.
+    user = models.User(**values)
+    make_transient_to_detached(user)
+    db.add(user)
+    return user
+
+
+## get_current_user
+async def get_current_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+                                ) -> models.User:
+    user_id = _user_id_from_token(token)
+
+    values = user_cache.get(user_id)
+    if values is not None:
+        return _attach_cached_user(db, values)
+
     result = await db.execute(
-        select(models.User).where(models.User.id == user_id_int),
+        select(models.User).where(models.User.id == user_id),
     )
     user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
+            headers=CREDENTIALS_EXCEPTION_HEADERS,
         )
+    user_cache.set(
+        user_id,
+        {attr.key: getattr(user, attr.key) for attr in models.User.__mapper__.column_attrs},
+    )
     return user
 
 CurrentUser = Annotated[models.User, Depends(get_current_user)]
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""Posts per second: one create_post call per post vs. POST /api/posts/bulk.
+
+Usage:
+    python benchmarks/bulk_create.py [DATABASE_URL] [posts] [batch]
+
+DATABASE_URL defaults to a throwaway SQLite file. Point it at Postgres
+(postgresql+asyncpg://...) to include network round trips; the tables are
+created and dropped by the script, so use a scratch database.
+"""
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import Base
+from models import Post, User
+from routers.posts import create_post, create_posts_bulk
+from schemas import PostCreate
+
+
+async def run(url: str, post_count: int, batch: int) -> None:
+    engine = create_async_engine(url, poolclass=NullPool if url.startswith("sqlite") else None)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with Session() as db:
+        user = User(username="bench", email="bench@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+
+    posts = [PostCreate(title=f"Post {i}", content="Body text " * 40) for i in range(post_count)]
+
+    async def measure(label, operation):
+        started = time.perf_counter()
+        async with Session() as db:
+            current_user = await db.get(User, user.id)
+            await operation(db, current_user)
+        elapsed = time.perf_counter() - started
+        async with Session() as db:
+            stored = await db.scalar(select(func.count()).select_from(Post))
+        print(f"{label:<22} {post_count / elapsed:9.0f} posts/s   {elapsed:7.3f} s   ({stored} rows)")
+
+    async def sequential(db, current_user):
+        for post in posts:
+            await create_post(post, current_user, db)
+
+    async def bulk(db, current_user):
+        for i in range(0, post_count, batch):
+            await create_posts_bulk(posts[i:i + batch], current_user, db)
+
+    print(f"{engine.dialect.name}, {post_count} posts, bulk batches of {batch}")
+    await measure("sequential (before)", sequential)
+    async with engine.begin() as conn:
+        await conn.execute(Post.__table__.delete())
+    await measure("bulk (after)", bulk)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    database_url = sys.argv[1] if len(sys.argv) > 1 else "sqlite+aiosqlite:///./bench.db"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    asyncio.run(run(database_url, count, batch_size))
+    if database_url == "sqlite+aiosqlite:///./bench.db":
+        os.remove("bench.db")
@@ -0,0 +1,129 @@
+"""Profile image throughput and latency: thread pool vs. the process-pool engine.
+
+Usage:
+    python benchmarks/image_pipeline.py [uploads] [concurrency] [PHOTO_DIR]
+
+Without PHOTO_DIR a corpus of synthetic 4000x3000 JPEGs is generated. Each
+upload is also timed against a 10 ms event loop ticker, so "loop lag" shows
+how badly request handling stalls while images are being processed.
+"""
+# pylint: disable=wrong-import-position
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+from PIL import Image, ImageOps
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from image_utils import PROFILE_IMAGE_FORMATS, PROFILE_IMAGE_SIZES, ImageEngine
+
+
+## Previous implementation (full-size decode on the thread pool), kept for comparison
+def legacy_process(data: bytes, directory: Path) -> None:
+    stem = uuid.uuid4().hex
+    with Image.open(io.BytesIO(data)) as original:
+        img = ImageOps.exif_transpose(original)
+        largest = max(PROFILE_IMAGE_SIZES)
+        img = ImageOps.fit(img, (largest, largest), method=Image.Resampling.LANCZOS)
+        for size in sorted(PROFILE_IMAGE_SIZES, reverse=True):
+            variant = img if size == largest else img.resize((size, size), Image.Resampling.LANCZOS)
+            for ext, image_format, options in PROFILE_IMAGE_FORMATS:
+                variant.save(directory / f"{stem}_{size}.{ext}", image_format, **options)
+
+
+def load_corpus(photo_dir: str | None, count: int = 4) -> list[bytes]:
+    if photo_dir:
+        return [path.read_bytes() for path in sorted(Path(photo_dir).glob("*.jp*g"))]
+    corpus = []
+    for seed in range(count):
+        noise = Image.effect_noise((4000, 3000), 40 + seed * 10)
+        photo = Image.merge("RGB", (noise, noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT), noise))
+        buffer = io.BytesIO()
+        photo.save(buffer, "JPEG", quality=90)
+        corpus.append(buffer.getvalue())
+    return corpus
+
+
+async def measure(label, corpus, uploads, concurrency, process) -> None:
+    timings = []
+    lags = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - started - 0.01)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await process(corpus[i % len(corpus)])
+            timings.append(time.perf_counter() - started)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(i) for i in range(uploads)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+
+    timings.sort()
+    lags.sort()
+    print(
+        f"{label:<20} {uploads / elapsed:6.2f} images/s   "
+        f"p50 {timings[len(timings) // 2] * 1000:7.1f} ms   "
+        f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.1f} ms   "
+        f"loop lag p95 {lags[int(len(lags) * 0.95)] * 1000:6.1f} ms",
+    )
+
+
+async def run(uploads: int, concurrency: int, photo_dir: str | None) -> None:
+    corpus = load_corpus(photo_dir)
+    print(f"{len(corpus)} photos, {uploads} uploads, {concurrency} concurrent")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        await measure(
+            "thread pool (before)", corpus, uploads, concurrency,
+            lambda data: run_in_threadpool(legacy_process, data, directory),
+        )
+
+        # The endpoint spools each upload to a file as it reads it; the
+        # engine takes the path
+        sources = []
+        for number, data in enumerate(corpus):
+            sources.append(directory / f"upload-{number}")
+            sources[-1].write_bytes(data)
+
+        engine = ImageEngine(
+            max_workers=settings.image_workers,
+            max_queue=uploads,
+            retry_after_seconds=settings.image_retry_after_seconds,
+        )
+        # Start the workers outside the measured run
+        await asyncio.gather(*(
+            engine.process(sources[0], directory) for _ in range(settings.image_workers)
+        ))
+        await measure(
+            "process pool (after)", sources, uploads, concurrency,
+            lambda source: engine.process(source, directory),
+        )
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    upload_count = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    concurrent_uploads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    asyncio.run(run(upload_count, concurrent_uploads, sys.argv[3] if len(sys.argv) > 3 else None))
@@ -0,0 +1,135 @@
+"""CPU time and peak memory of the post list endpoints, ORM + Pydantic vs. projected rows.
+
+Usage:
+    python benchmarks/list_serialization.py [DATABASE_URL] [posts] [iterations]
+
+Seeds one author with 10k posts by default. "user posts" returns every one
+of them, like GET /api/users/{id}/posts; "feed page" is one 50-post page of
+GET /api/posts. CPU time is process time, so it includes the driver thread.
+"""
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from datetime import UTC, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import NullPool
+
+from database import Base
+from models import Post, User
+from pagination import paginate_post_rows, paginate_posts
+from schemas import PostPage, PostResponse
+from serializers import dumps, post_row_to_dict, post_rows_query
+
+posts_adapter = TypeAdapter(list[PostResponse])
+
+
+## Previous implementation: full objects, validated with from_attributes
+async def legacy_user_posts(db, user_id):
+    result = await db.execute(
+        select(Post)
+        .options(selectinload(Post.author))
+        .where(Post.user_id == user_id)
+        .order_by(Post.date_posted.desc(), Post.id.desc()),
+    )
+    posts = posts_adapter.validate_python(result.scalars().all(), from_attributes=True)
+    return posts_adapter.dump_json(posts)
+
+
+async def legacy_feed_page(db, _user_id):
+    posts, next_cursor = await paginate_posts(
+        db, select(Post).options(selectinload(Post.author)), None, 50,
+    )
+    return PostPage(posts=posts, next_cursor=next_cursor).model_dump_json().encode()
+
+
+async def projected_user_posts(db, user_id):
+    result = await db.execute(
+        post_rows_query()
+        .where(Post.user_id == user_id)
+        .order_by(Post.date_posted.desc(), Post.id.desc()),
+    )
+    return dumps([post_row_to_dict(row) for row in result.all()])
+
+
+async def projected_feed_page(db, _user_id):
+    rows, next_cursor = await paginate_post_rows(db, post_rows_query(), None, 50)
+    return dumps({"posts": [post_row_to_dict(row) for row in rows], "next_cursor": next_cursor})
+
+
+async def run(url: str, post_count: int, iterations: int) -> None:
+    engine = create_async_engine(url, poolclass=NullPool if url.startswith("sqlite") else None)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with Session() as db:
+        user = User(username="bench", email="bench@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+        started = datetime.now(UTC).replace(microsecond=0)
+        await db.execute(
+            insert(Post),
+            [
+                {
+                    "title": f"Post {i}",
+                    "content": "Body text " * 40,
+                    "user_id": user.id,
+                    # Distinct timestamps, as in real data; ties would force a full sort
+                    "date_posted": started - timedelta(minutes=i),
+                }
+                for i in range(post_count)
+            ],
+        )
+        await db.commit()
+
+    async def measure(label, operation):
+        cpu = []
+        peaks = []
+        size = 0
+        for _ in range(iterations):
+            async with Session() as db:
+                started = time.process_time()
+                body = await operation(db, user.id)
+                cpu.append(time.process_time() - started)
+                size = len(body)
+            # Separate run for memory: tracemalloc slows allocation down
+            async with Session() as db:
+                tracemalloc.start()
+                await operation(db, user.id)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+        cpu.sort()
+        print(
+            f"{label:<28} cpu p50 {cpu[len(cpu) // 2] * 1000:8.1f} ms   "
+            f"peak {max(peaks) / 1024 / 1024:7.2f} MiB   body {size / 1024:8.1f} KiB",
+        )
+
+    print(f"{engine.dialect.name}, {post_count} posts, {iterations} requests each")
+    await measure("user posts (before)", legacy_user_posts)
+    await measure("user posts (after)", projected_user_posts)
+    await measure("feed page (before)", legacy_feed_page)
+    await measure("feed page (after)", projected_feed_page)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    database_url = sys.argv[1] if len(sys.argv) > 1 else "sqlite+aiosqlite:///./bench.db"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    asyncio.run(run(database_url, count, repeat))
+    if database_url == "sqlite+aiosqlite:///./bench.db":
+        os.remove("bench.db")
@@ -0,0 +1,81 @@
+"""Cost of the /metrics recording: per SQL statement and per request.
+
+Usage:
+    python benchmarks/metrics_overhead.py [DATABASE_URL] [statements] [rounds]
+
+Runs the same primary-key SELECT on a plain and an instrumented engine, then
+times the per-request bookkeeping done by the metrics middleware on its own.
+"""
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import metrics
+from database import Base, instrument_engine
+from models import User
+
+
+async def statement_microseconds(url: str, statements: int, rounds: int) -> dict[str, float]:
+    engines = {"plain engine": create_async_engine(url), "instrumented engine": create_async_engine(url)}
+    instrument_engine(engines["instrumented engine"])
+    async with engines["plain engine"].begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # aiosqlite hands every statement to a thread, which is noisy; alternate
+    # the engines and keep the best round of each
+    query = select(User.id).where(User.id == 1)
+    best = dict.fromkeys(engines, float("inf"))
+    for _ in range(rounds):
+        for label, engine in engines.items():
+            async with engine.connect() as conn:
+                await conn.execute(query)
+                started = time.perf_counter()
+                for _ in range(statements):
+                    await conn.execute(query)
+                elapsed = time.perf_counter() - started
+            best[label] = min(best[label], elapsed / statements * 1e6)
+
+    async with engines["plain engine"].begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    for engine in engines.values():
+        await engine.dispose()
+    return best
+
+
+def request_bookkeeping_microseconds(iterations: int = 100_000) -> float:
+    scope = {"path": "/api/posts/1", "root_path": "", "app_root_path": ""}
+
+    def one_request():
+        stats = metrics.RequestStats(scope)
+        token = metrics.current_request.set(stats)
+        metrics.record_statement("SELECT 1", stats.started, 0.0002)
+        metrics.current_request.reset(token)
+        metrics.record_request(stats, "GET", 200)
+
+    return timeit.timeit(one_request, number=iterations) / iterations * 1e6
+
+
+async def run(url: str, statements: int, rounds: int) -> None:
+    print(f"{url.split(':')[0]}, {rounds} rounds of {statements} statements")
+    for label, microseconds in (await statement_microseconds(url, statements, rounds)).items():
+        print(f"{label:<24} {microseconds:7.1f} us per statement")
+    print(f"{'request bookkeeping':<24} {request_bookkeeping_microseconds():7.1f} us per request "
+          "(one statement)")
+
+
+if __name__ == "__main__":
+    database_url = sys.argv[1] if len(sys.argv) > 1 else "sqlite+aiosqlite:///./bench.db"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    asyncio.run(run(database_url, count, repeat))
+    if database_url == "sqlite+aiosqlite:///./bench.db":
+        os.remove("bench.db")
@@ -0,0 +1,121 @@
+"""Round trips and latency of post updates/deletes, before and after RETURNING.
+
+Usage:
+    python benchmarks/post_mutations.py [DATABASE_URL] [iterations]
+
+DATABASE_URL defaults to a throwaway SQLite file. Point it at Postgres
+(postgresql+asyncpg://...) to measure network round trips there; the
+tables are created and dropped by the script, so use a scratch database.
+"""
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import Base
+from models import Post, User
+from routers.posts import delete_post, update_post_full
+from schemas import PostCreate
+
+
+## Previous implementation, kept here for comparison
+async def legacy_update(db, post_id, current_user, post_data):
+    result = await db.execute(select(Post).where(Post.id == post_id))
+    post = result.scalars().first()
+    assert post.user_id == current_user.id
+    post.title = post_data.title
+    post.content = post_data.content
+    await db.commit()
+    await db.refresh(post, attribute_names=["author"])
+    return post
+
+
+async def legacy_delete(db, post_id, current_user):
+    result = await db.execute(select(Post).where(Post.id == post_id))
+    post = result.scalars().first()
+    assert post.user_id == current_user.id
+    await db.delete(post)
+    await db.commit()
+
+
+class RoundTripCounter:
+    def __init__(self, sync_engine):
+        self.count = 0
+        event.listen(sync_engine, "before_cursor_execute", self._statement)
+        event.listen(sync_engine, "commit", self._commit)
+
+    def _statement(self, *_args):
+        self.count += 1
+
+    def _commit(self, *_args):
+        self.count += 1
+
+
+async def run(url: str, iterations: int) -> None:
+    engine = create_async_engine(url, poolclass=NullPool if url.startswith("sqlite") else None)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with Session() as db:
+        user = User(username="bench", email="bench@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+        db.add_all(
+            Post(title=f"Post {i}", content="Body", user_id=user.id)
+            for i in range(iterations * 4)
+        )
+        await db.commit()
+        post_ids = list((await db.scalars(select(Post.id).order_by(Post.id))).all())
+
+    counter = RoundTripCounter(engine.sync_engine)
+    data = PostCreate(title="Updated", content="Updated body")
+
+    async def measure(label, ids, operation):
+        counter.count = 0
+        timings = []
+        for post_id in ids:
+            async with Session() as db:
+                current_user = await db.get(User, user.id)
+                started = time.perf_counter()
+                await operation(db, post_id, current_user)
+                timings.append(time.perf_counter() - started)
+        # The db.get() for the current user is not part of the operation
+        per_call = (counter.count - len(ids)) / len(ids)
+        timings.sort()
+        print(
+            f"{label:<16} {per_call:5.1f} round trips/call   "
+            f"p50 {timings[len(timings) // 2] * 1000:7.3f} ms   "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.3f} ms",
+        )
+
+    chunks = [post_ids[i * iterations:(i + 1) * iterations] for i in range(4)]
+    print(f"{engine.dialect.name}, {iterations} calls each")
+    await measure("update (before)", chunks[0],
+                  lambda db, pid, u: legacy_update(db, pid, u, data))
+    await measure("update (after)", chunks[1],
+                  lambda db, pid, u: update_post_full(pid, u, data, db))
+    await measure("delete (before)", chunks[2], legacy_delete)
+    await measure("delete (after)", chunks[3],
+                  lambda db, pid, u: delete_post(pid, u, db))
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    database_url = sys.argv[1] if len(sys.argv) > 1 else "sqlite+aiosqlite:///./bench.db"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    asyncio.run(run(database_url, count))
+    if database_url == "sqlite+aiosqlite:///./bench.db":
+        os.remove("bench.db")
@@ -0,0 +1,118 @@
+"""Search latency: LIKE '%term%' scans vs. the full-text index.
+
+Usage:
+    python benchmarks/search.py [DATABASE_URL] [posts] [queries]
+
+Seeds 1M synthetic posts by default (a few minutes on SQLite; pass a smaller
+count for a quick run). The tables are created and dropped by the script, so
+use a scratch database when pointing it at Postgres.
+"""
+# pylint: disable=wrong-import-position
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+from sqlalchemy import insert, or_
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import Base
+from models import Post, User
+from search import search_posts
+from serializers import post_rows_query
+
+# Zipf-like vocabulary: a few very common words and a long tail of rare ones.
+# No word is a substring of another, so LIKE matches the same posts.
+VOCABULARY = [f"w{i}x" for i in range(20_000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=words))
+
+
+## Previous approach, for comparison
+async def like_search(db, term, limit):
+    pattern = f"%{term}%"
+    result = await db.execute(
+        post_rows_query()
+        .where(or_(Post.title.ilike(pattern), Post.content.ilike(pattern)))
+        .order_by(Post.id.desc())
+        .limit(limit),
+    )
+    return result.all()
+
+
+async def run(url: str, post_count: int, query_count: int) -> None:
+    engine = create_async_engine(url, poolclass=NullPool if url.startswith("sqlite") else None)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    rng = random.Random(42)
+    started = time.perf_counter()
+    async with Session() as db:
+        user = User(username="bench", email="bench@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+        for offset in range(0, post_count, 10_000):
+            await db.execute(
+                insert(Post),
+                [
+                    {
+                        "title": synthetic_text(rng, 5),
+                        "content": synthetic_text(rng, 60),
+                        "user_id": user.id,
+                    }
+                    for _ in range(min(10_000, post_count - offset))
+                ],
+            )
+            await db.commit()
+    print(f"{engine.dialect.name}, {post_count} posts seeded and indexed in "
+          f"{time.perf_counter() - started:.1f} s")
+
+    # Ranking has to score every match, so common words cost more than rare
+    # ones; LIKE stops early on common words and scans everything for rare ones
+    term_sets = {
+        "common": VOCABULARY[:query_count],
+        "rare": [VOCABULARY[i] for i in rng.sample(range(1000, len(VOCABULARY)), query_count)],
+    }
+
+    async def measure(label, terms, operation):
+        timings = []
+        for term in terms:
+            async with Session() as db:
+                started = time.perf_counter()
+                await operation(db, term)
+                timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(
+            f"{label:<32} p50 {timings[len(timings) // 2] * 1000:9.1f} ms   "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1000:9.1f} ms",
+        )
+
+    for kind, terms in term_sets.items():
+        await measure(f"{kind} terms, LIKE (before)", terms,
+                      lambda db, term: like_search(db, term, 10))
+        await measure(f"{kind} terms, full-text (after)", terms,
+                      lambda db, term: search_posts(db, term, None, 10))
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    database_url = sys.argv[1] if len(sys.argv) > 1 else "sqlite+aiosqlite:///./bench.db"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    asyncio.run(run(database_url, count, queries))
+    if database_url == "sqlite+aiosqlite:///./bench.db":
+        os.remove("bench.db")
@@ -0,0 +1,153 @@
+"""Time to first byte, total time and peak memory of the user posts page, buffered vs. streamed.
+
+Usage:
+    python benchmarks/streamed_pages.py [DATABASE_URL] [posts] [iterations]
+
+Seeds one author with 5k posts by default and renders /users/{id}/posts
+both ways, without the page cache. "Buffered" is the previous
+TemplateResponse: every post loaded, then one string; "streamed" is the
+StreamingTemplates response iterated the way the server sends it.
+"""
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from datetime import UTC, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import defer, joinedload, selectinload
+from sqlalchemy.pool import NullPool
+from starlette.requests import Request
+
+from database import Base
+from main import app, streaming_templates, templates
+from models import Post, User
+from pagination import PostStream
+
+
+def page_request(user_id: int) -> Request:
+    return Request({
+        "type": "http",
+        "app": app,
+        "router": app.router,
+        "method": "GET",
+        "scheme": "http",
+        "server": ("bench", 80),
+        "path": f"/users/{user_id}/posts",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+    })
+
+
+def user_posts_query(user_id: int):
+    return (
+        select(Post)
+        .where(Post.user_id == user_id)
+        .order_by(Post.date_posted.desc(), Post.id.desc())
+    )
+
+
+async def buffered(db, user):
+    result = await db.execute(user_posts_query(user.id).options(selectinload(Post.author)))
+    response = templates.TemplateResponse(
+        page_request(user.id),
+        "user_posts.html",
+        {"posts": result.scalars().all(), "user": user, "title": "bench"},
+    )
+    yield response.body
+
+
+async def streamed(db, user):
+    posts = PostStream(
+        db,
+        user_posts_query(user.id).options(
+            joinedload(Post.author), defer(Post.content, raiseload=True),
+        ),
+    )
+    response = streaming_templates.TemplateResponse(
+        page_request(user.id),
+        "user_posts.html",
+        {"posts": posts, "user": user, "title": "bench"},
+    )
+    async for chunk in response.body_iterator:
+        yield chunk
+
+
+async def run(url: str, post_count: int, iterations: int) -> None:
+    engine = create_async_engine(url, poolclass=NullPool if url.startswith("sqlite") else None)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with Session() as db:
+        user = User(username="bench", email="bench@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+        started = datetime.now(UTC).replace(microsecond=0)
+        await db.execute(
+            insert(Post),
+            [
+                {
+                    "title": f"Post {i}",
+                    "content": "Body text " * 40,
+                    "user_id": user.id,
+                    "date_posted": started - timedelta(minutes=i),
+                }
+                for i in range(post_count)
+            ],
+        )
+        await db.commit()
+
+    async def measure(label, render):
+        first_bytes = []
+        totals = []
+        peaks = []
+        size = 0
+        for _ in range(iterations):
+            async with Session() as db:
+                size = 0
+                started = time.perf_counter()
+                async for chunk in render(db, user):
+                    if not size:
+                        first_bytes.append(time.perf_counter() - started)
+                    size += len(chunk)
+                totals.append(time.perf_counter() - started)
+            # Separate run for memory: tracemalloc slows allocation down
+            async with Session() as db:
+                tracemalloc.start()
+                async for _chunk in render(db, user):
+                    pass
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+        first_bytes.sort()
+        totals.sort()
+        print(
+            f"{label:<10} first byte p50 {first_bytes[len(first_bytes) // 2] * 1000:8.1f} ms   "
+            f"total p50 {totals[len(totals) // 2] * 1000:8.1f} ms   "
+            f"peak {max(peaks) / 1024 / 1024:7.2f} MiB   body {size / 1024:8.1f} KiB",
+        )
+
+    print(f"{engine.dialect.name}, {post_count} posts, {iterations} requests each")
+    await measure("buffered", buffered)
+    await measure("streamed", streamed)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    database_url = sys.argv[1] if len(sys.argv) > 1 else "sqlite+aiosqlite:///./bench.db"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    asyncio.run(run(database_url, count, repeat))
+    if database_url == "sqlite+aiosqlite:///./bench.db":
+        os.remove("bench.db")
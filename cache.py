@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from config import settings
+
+
+class TTLCache:
+    """A small in-process LRU cache whose entries also expire after a TTL.
+
+    Not thread-safe: it is meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float | None = None) -> None:
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        self._data[key] = (time.monotonic() + ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)  # evict least recently used
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class PageCache(TTLCache):
+    """Cache of rendered HTML pages, invalidated by tags.
+
+    Each page is stored with the tags it depends on (for example
+    ``post:3`` or ``user:1``) and writes drop every page carrying one
+    of the tags they touch.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        super().__init__(maxsize, ttl_seconds)
+        # Bumped on every invalidation so a render that started before a
+        # write is not stored after it.
+        self.generation = 0
+        self.last_invalidated = 0.0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().get(key)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl_seconds: float | None = None,
+        *,
+        tags: set[str] = frozenset(),
+        generation: int | None = None,
+    ) -> None:
+        if generation is not None and generation != self.generation:
+            return
+        super().set(key, (frozenset(tags), value), ttl_seconds)
+
+    def invalidate(self, *tags: str) -> None:
+        self.generation += 1
+        self.last_invalidated = time.monotonic()
+        tags = set(tags)
+        stale = [
+            key
+            for key, (_, (entry_tags, _)) in self._data.items()
+            if entry_tags & tags
+        ]
+        for key in stale:
+            del self._data[key]
+
+
+page_cache = PageCache(
+    maxsize=settings.page_cache_max_entries,
+    ttl_seconds=settings.page_cache_ttl_seconds,
+)
@@ -13,5 +13,59 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 30
 
     max_upload_size_bytes: int = 5 * 1024 * 1024  # 5 MB
+    upload_chunk_size_bytes: int = 64 * 1024
+
+    db_echo: bool = False  # logs every statement; for local debugging only
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 100  # asyncpg; set to 0 behind PgBouncer
+    query_budget_strict: bool = False  # raise instead of logging a warning; the tests turn it on
+
+    # Request profiling is off unless a token or a sample rate is set
+    profile_token: SecretStr | None = None  # send as X-Profile-Token to profile one request
+    profile_sample_rate: float = 0.0  # fraction of all requests to profile, e.g. 0.001
+    profile_interval_seconds: float = 0.005  # stack sampling period
+    profile_dir: str = "profiles"
+    profile_max_kept: int = 100  # oldest profiles are deleted beyond this
+
+    slow_query_threshold_seconds: float | None = 0.5  # unset (null) to turn the log off
+    slow_query_explain: bool = True  # fetch the plan with EXPLAIN, never EXPLAIN ANALYZE
+    slow_query_log_path: str = "logs/slow_queries.jsonl"
+    slow_query_log_max_bytes: int = 5 * 1024 * 1024
+    slow_query_log_backups: int = 3
+    admin_token: SecretStr | None = None  # X-Admin-Token for /admin endpoints; unset disables them
+
+    # JSON list in the environment, e.g. DATABASE_REPLICA_URLS='["postgresql+asyncpg://..."]'
+    database_replica_urls: list[str] = []
+    read_your_writes_seconds: float = 5
+
+    auth_cache_ttl_seconds: int = 60
+    auth_cache_max_entries: int = 1024
+
+    page_cache_max_entries: int = 512
+    page_cache_ttl_seconds: int = 300  # safety net for writes made by other workers
+    page_cache_max_body_bytes: int = 512 * 1024  # larger streamed pages are not cached
+
+    password_hash_workers: int = 2
+    password_hash_max_queue: int = 32  # waiting hashes before returning 503
+    password_hash_retry_after_seconds: int = 1
+
+    image_workers: int = 2  # worker processes for profile image resizing
+    image_max_queue: int = 8  # waiting uploads before returning 503
+    image_retry_after_seconds: int = 2
+
+    job_queue_url: str = "sqlite+aiosqlite:///./jobs.db"  # local file, not the app database
+    job_poll_interval_seconds: float = 5  # enqueue wakes the worker; this catches retries
+    job_max_attempts: int = 5
+    job_retry_base_seconds: float = 2  # doubled after every failed attempt
+    job_lease_seconds: float = 300  # renewed while a job runs; expired leases are re-run
+
+    posts_page_size: int = 10
+    max_posts_page_size: int = 50  # upper bound for the ?limit= query parameter
+    max_bulk_posts: int = 500  # posts accepted by one POST /api/posts/bulk
+    export_batch_size: int = 1000  # rows fetched per round trip by /api/posts/export
 
 settings = Settings()   #Loaded from .env file
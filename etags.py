@@ -0,0 +1,111 @@
+import hashlib
+from datetime import UTC, datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Sequence
+
+from fastapi import Request, Response, status
+from sqlalchemy import Select, select
+
+from models import Post, User
+
+
+## Version Rows
+# Every change to a post or its author bumps one of these columns, so a
+# digest of them identifies the representation without loading the rows.
+def post_version_query() -> Select:
+    return select(
+        Post.id, Post.version, Post.updated_at,
+        User.id, User.version, User.updated_at,
+    ).join(Post.author)
+
+
+def post_versions(post: Post) -> tuple:
+    """The post_version_query() row for an already loaded post."""
+    author = post.author
+    return (
+        post.id, post.version, post.updated_at,
+        author.id, author.version, author.updated_at,
+    )
+
+
+def user_versions(user: User) -> tuple:
+    return (user.id, user.version, user.updated_at)
+
+
+def user_version_query() -> Select:
+    return select(User.id, User.version, User.updated_at)
+
+
+## Validators
+def make_validators(
+    scope: str,
+    rows: Iterable[Sequence],
+    collection: bool = False,
+) -> tuple[str, datetime | None]:
+    """Return a strong ETag and Last-Modified time for a set of version rows.
+
+    Collections get no Last-Modified: deleting a row does not move the
+    newest remaining timestamp, so If-Modified-Since would keep answering
+    304 for a list that has lost a post. They revalidate by ETag only.
+    """
+    rows = [tuple(row) for row in rows]
+    digest = hashlib.blake2b(repr((scope, rows)).encode(), digest_size=16)
+    if collection:
+        return f'"{digest.hexdigest()}"', None
+    timestamps = [
+        _as_utc(value) for row in rows for value in row if isinstance(value, datetime)
+    ]
+    return f'"{digest.hexdigest()}"', max(timestamps, default=None)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; func.now() stores them in UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value.astimezone(UTC)
+
+
+def has_conditional_headers(request: Request) -> bool:
+    return (
+        "if-none-match" in request.headers
+        or "if-modified-since" in request.headers
+    )
+
+
+def is_not_modified(
+    request: Request,
+    etag: str,
+    last_modified: datetime | None,
+) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=UTC)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def validator_headers(etag: str, last_modified: datetime | None) -> dict[str, str]:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def not_modified_response(etag: str, last_modified: datetime | None) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers=validator_headers(etag, last_modified),
+    )
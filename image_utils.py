@@ -1,36 +1,265 @@
+import asyncio
+import multiprocessing
+import re
+import time
 import uuid
-from io import BytesIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import BinaryIO
+from fastapi import HTTPException, status
 from PIL import Image, ImageOps
 
+from config import settings
+from metrics import image_processing_duration
+
 PROFILE_PICS_DIR = Path("media/profile_pics")
 
+## Image Signature Sniffing
+# Checked against the first bytes of an upload before Pillow decodes anything
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "jpeg",
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+}
+
+
+def sniff_image_type(header: bytes) -> str | None:
+    for signature, image_type in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return image_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
 ## Process Image Function
-def process_profile_image(content: bytes) -> str:
-    with Image.open(BytesIO(content)) as original:
-        img = ImageOps.exif_transpose(original)
+# Every upload is stored at each size, in WebP and JPEG, as <stem>_<size>.<ext>.
+# User.image_file points at the largest JPEG, which every browser can show.
+PROFILE_IMAGE_SIZES = (64, 128, 300)
+PROFILE_IMAGE_FORMATS = (
+    ("webp", "WEBP", {"quality": 80}),
+    ("jpg", "JPEG", {"quality": 85, "optimize": True}),
+)
+
 
-        img = ImageOps.fit(img, (300, 300), method=Image.Resampling.LANCZOS)
+def process_profile_image(
+    source: BinaryIO,
+    directory: Path | None = None,
+) -> tuple[str, list[int]]:
+    directory = PROFILE_PICS_DIR if directory is None else directory
+    stem = uuid.uuid4().hex
+    directory.mkdir(parents=True, exist_ok=True)
+
+    with Image.open(source) as original:
+        largest = max(PROFILE_IMAGE_SIZES)
+        # JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 scale that still
+        # covers the target square; a no-op for other formats
+        original.draft("RGB", (largest, largest))
+
+        img = ImageOps.exif_transpose(original)
+        img = ImageOps.fit(img, (largest, largest), method=Image.Resampling.LANCZOS)
 
         if img.mode in ("RGBA", "LA", "P"):
             img = img.convert("RGB")
 
-        filename = f"{uuid.uuid4().hex}.jpg"
-        filepath = PROFILE_PICS_DIR / filename
+        # Smaller sizes are resized from the already fitted square
+        for size in sorted(PROFILE_IMAGE_SIZES, reverse=True):
+            if size == largest:
+                variant = img
+            else:
+                variant = img.resize((size, size), Image.Resampling.LANCZOS)
+            for ext, image_format, options in PROFILE_IMAGE_FORMATS:
+                filepath = directory / f"{stem}_{size}.{ext}"
+                variant.save(filepath, image_format, **options)
+
+    return f"{stem}_{largest}.jpg", sorted(PROFILE_IMAGE_SIZES)
+
+
+def _timed_process_profile_image(
+    source: Path,
+    directory: Path,
+) -> tuple[tuple[str, list[int]], float]:
+    # Runs in a worker process; the timing excludes queueing
+    started = time.perf_counter()
+    with open(source, "rb") as data:
+        result = process_profile_image(data, directory)
+    return result, time.perf_counter() - started
+
+## Image Engine
+class ImageEngine:
+    """Process profile images in a small pool of worker processes.
+
+    Resizing and encoding hold the GIL for most of their run, so threads
+    stall the event loop under concurrent uploads. Jobs beyond
+    ``max_workers + max_queue`` are rejected with 503.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_queue: int,
+        retry_after_seconds: int,
+        recent_jobs: int = 100,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after_seconds = retry_after_seconds
+        # Workers start on first use; spawn keeps them free of the parent's
+        # threads and open connections
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # Only touched from the event loop thread, so no lock is needed
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        # (seconds in the worker, seconds end to end) per finished job
+        self.recent_jobs: deque[tuple[float, float]] = deque(maxlen=recent_jobs)
+
+    def _release(self) -> None:
+        self._pending -= 1
 
-        PROFILE_PICS_DIR.mkdir(parents=True, exist_ok=True)
+    async def process(
+        self,
+        source: Path,
+        directory: Path | None = None,
+        delete_source: bool = False,
+    ) -> tuple[str, list[int]]:
+        """Process the image file at ``source``.
 
-        img.save(filepath, "JPEG", quality=85, optimize=True)
+        Only the path is sent to the worker, so the image is never held in
+        this process's memory or pickled across. With ``delete_source`` the
+        file is removed once the worker is done with it, or straight away if
+        the job is rejected.
+        """
+        if self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            if delete_source:
+                source.unlink(missing_ok=True)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy. Please try again shortly.",
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
 
-    return filename
+        directory = PROFILE_PICS_DIR if directory is None else directory
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        started = time.perf_counter()
+        future = self._executor.submit(_timed_process_profile_image, source, directory)
+        # The slot and the source file are let go when the worker finishes,
+        # not when the caller stops waiting: a cancelled upload is still
+        # being resized in its worker.
+        future.add_done_callback(
+            lambda _: _worker_done(loop, self._release, source if delete_source else None),
+        )
+        try:
+            result, work_seconds = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Nothing will reference what the worker writes; remove it once
+            # it is written
+            future.add_done_callback(lambda done: _discard_output(done, directory))
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+        elapsed = time.perf_counter() - started
+        self.completed += 1
+        self.total_seconds += elapsed
+        self.recent_jobs.append((work_seconds, elapsed))
+        image_processing_duration.observe(work_seconds, "work")
+        image_processing_duration.observe(elapsed, "total")
+        return result
+
+    def stats(self) -> dict:
+        """Snapshot of engine usage and recent job timings for monitoring."""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self._pending, self.max_workers),
+            "queued": max(self._pending - self.max_workers, 0),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "total_seconds": self.total_seconds,
+            "recent_work_seconds": _percentiles([job[0] for job in self.recent_jobs]),
+            "recent_total_seconds": _percentiles([job[1] for job in self.recent_jobs]),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _worker_done(loop: asyncio.AbstractEventLoop, release, source: Path | None) -> None:
+    # From the executor's management thread; the loop may already be gone
+    # at shutdown
+    if source is not None:
+        source.unlink(missing_ok=True)
+    try:
+        loop.call_soon_threadsafe(release)
+    except RuntimeError:
+        pass
+
+
+def _discard_output(future, directory: Path) -> None:
+    if future.cancelled() or future.exception() is not None:
+        return
+    (filename, sizes), _ = future.result()
+    delete_profile_image(filename, sizes, directory)
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    return {
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        "max": ordered[-1],
+    }
 
 ## Delete Profile Image Function
-def delete_profile_image(filename: str | None) -> None:
+# The largest JPEG's name as written by process_profile_image
+GENERATED_IMAGE_NAME = re.compile(r"(?P<stem>[0-9a-f]{32})_\d+\.jpg")
+
+
+def delete_profile_image(
+    filename: str | None,
+    image_sizes: list[int] | None = None,
+    directory: Path | None = None,
+) -> None:
+    """Remove an upload and the exact size and format variants stored with it.
+
+    Names are built, never globbed, so a legacy or hand-placed file is the
+    only file removed. Jobs queued without ``image_sizes`` fall back to the
+    standard sizes for generated names.
+    """
     if filename is None:
         return
 
-    filepath = PROFILE_PICS_DIR / filename
-    if filepath.exists():
-        filepath.unlink()
+    directory = PROFILE_PICS_DIR if directory is None else directory
+    paths = {directory / filename}
+    generated = GENERATED_IMAGE_NAME.fullmatch(filename)
+    if generated:
+        stem = generated["stem"]
+        for size in image_sizes or PROFILE_IMAGE_SIZES:
+            for ext, _, _ in PROFILE_IMAGE_FORMATS:
+                paths.add(directory / f"{stem}_{size}.{ext}")
+
+    for filepath in paths:
+        filepath.unlink(missing_ok=True)
+
+    return None
+
 
-    return None
\ No newline at end of file
+image_engine = ImageEngine(
+    max_workers=settings.image_workers,
+    max_queue=settings.image_max_queue,
+    retry_after_seconds=settings.image_retry_after_seconds,
+)
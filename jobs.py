@@ -0,0 +1,282 @@
+import asyncio
+import inspect
+import logging
+import os
+import socket
+import time
+import uuid
+from collections.abc import Callable
+
+from sqlalchemy import (
+    JSON,
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    delete,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy import inspect as inspect_db
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+## Job Table
+# Kept in its own local SQLite file rather than the application database,
+# so queued side effects never compete with request traffic for connections.
+metadata = MetaData()
+
+jobs_table = Table(
+    "jobs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("payload", JSON, nullable=False),
+    Column("status", String(10), nullable=False, default="pending"),
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("run_at", Float, nullable=False, index=True),  # unix time
+    Column("last_error", Text, nullable=True),
+    # Set while running. Several app workers share the file, so a running
+    # job is only taken over once its lease has expired.
+    Column("worker_id", String(100), nullable=True),
+    Column("lease_expires_at", Float, nullable=True),  # unix time
+)
+LEASE_COLUMNS = ("worker_id", "lease_expires_at")
+
+
+def _create_tables(sync_conn) -> None:
+    metadata.create_all(sync_conn)
+    # Job files from before leases existed get the new columns
+    existing = {column["name"] for column in inspect_db(sync_conn).get_columns("jobs")}
+    for name in LEASE_COLUMNS:
+        if name not in existing:
+            column_type = jobs_table.c[name].type.compile(sync_conn.dialect)
+            sync_conn.exec_driver_sql(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+
+## Job Queue
+class JobQueue:
+    """Persistent in-process queue for side effects that can run after the response.
+
+    Handlers are registered by name and called with the job's payload as
+    keyword arguments; plain functions run on the thread pool. A failed job
+    is retried with exponential backoff until ``max_attempts``, then kept
+    with status ``failed`` for inspection.
+
+    A claimed job holds a lease of ``lease_seconds``, renewed while its
+    handler runs. A job whose lease has expired, because its worker died,
+    is claimed again by any queue sharing the file.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        poll_interval_seconds: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+        lease_seconds: float = 300,
+    ):
+        # Opening a SQLite file is cheap, and NullPool keeps no connection
+        # tied to a particular event loop
+        self.engine = create_async_engine(url, poolclass=NullPool)
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers: dict[str, Callable] = {}
+        self._ready = False
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+
+    def register(self, name: str, handler: Callable | None = None):
+        """Register a handler, directly or as a decorator."""
+        if handler is None:
+            return lambda func: self.register(name, func)
+        self.handlers[name] = handler
+        return handler
+
+    async def _ensure_table(self) -> None:
+        if not self._ready:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(_create_tables)
+            self._ready = True
+
+    async def enqueue(self, name: str, /, **payload) -> int:
+        if name not in self.handlers:
+            raise ValueError(f"No job handler registered for {name!r}")
+        await self._ensure_table()
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                insert(jobs_table)
+                .values(name=name, payload=payload, run_at=time.time())
+                .returning(jobs_table.c.id),
+            )
+            job_id = result.scalar_one()
+        self._wakeup.set()
+        return job_id
+
+    async def _claim(self):
+        now = time.time()
+        lease_expired = (jobs_table.c.status == "running") & or_(
+            # No lease: claimed by a version of this queue from before leases
+            jobs_table.c.lease_expires_at.is_(None),
+            jobs_table.c.lease_expires_at < now,
+        )
+        claimable = or_(
+            (jobs_table.c.status == "pending") & (jobs_table.c.run_at <= now),
+            lease_expired & (jobs_table.c.attempts < self.max_attempts),
+        )
+        async with self.engine.begin() as conn:
+            # A job that keeps taking its worker down with it (OOM, a crash
+            # in a C extension) never reaches the except in _run()
+            await conn.execute(
+                update(jobs_table)
+                .where(lease_expired, jobs_table.c.attempts >= self.max_attempts)
+                .values(
+                    status="failed",
+                    last_error="Lease expired on the last attempt",
+                    worker_id=None,
+                    lease_expires_at=None,
+                ),
+            )
+            due = (
+                select(jobs_table.c.id)
+                .where(claimable)
+                .order_by(jobs_table.c.run_at, jobs_table.c.id)
+                .limit(1)
+                .scalar_subquery()
+            )
+            result = await conn.execute(
+                update(jobs_table)
+                .where(jobs_table.c.id == due, claimable)
+                .values(
+                    status="running",
+                    attempts=jobs_table.c.attempts + 1,
+                    worker_id=self.worker_id,
+                    lease_expires_at=now + self.lease_seconds,
+                )
+                .returning(jobs_table),
+            )
+            return result.first()
+
+    def _owned(self, job):
+        return (jobs_table.c.id == job.id) & (jobs_table.c.worker_id == self.worker_id)
+
+    async def _renew_lease(self, job) -> None:
+        # Only ever cancelled by _run(), so failures are logged here and
+        # retried on the next tick rather than lost with the task
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(
+                        update(jobs_table)
+                        .where(self._owned(job))
+                        .values(lease_expires_at=time.time() + self.lease_seconds),
+                    )
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.warning(
+                    "Could not renew the lease of job %s (%s)", job.id, job.name,
+                    exc_info=True,
+                )
+
+    async def _run(self, job) -> None:
+        renewal = asyncio.create_task(self._renew_lease(job))
+        try:
+            handler = self.handlers[job.name]
+            if inspect.iscoroutinefunction(handler):
+                await handler(**job.payload)
+            else:
+                await run_in_threadpool(handler, **job.payload)
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            failed = job.attempts >= self.max_attempts
+            logger.warning(
+                "Job %s (%s) failed on attempt %s%s",
+                job.id, job.name, job.attempts, ", giving up" if failed else "",
+                exc_info=True,
+            )
+            async with self.engine.begin() as conn:
+                await conn.execute(
+                    update(jobs_table)
+                    .where(self._owned(job))
+                    .values(
+                        status="failed" if failed else "pending",
+                        run_at=time.time() + self.retry_base_seconds * 2 ** (job.attempts - 1),
+                        last_error=repr(err),
+                        worker_id=None,
+                        lease_expires_at=None,
+                    ),
+                )
+            return
+        finally:
+            renewal.cancel()
+
+        async with self.engine.begin() as conn:
+            await conn.execute(delete(jobs_table).where(self._owned(job)))
+
+    async def run_pending(self) -> int:
+        """Run every job that is due now; returns how many were attempted."""
+        await self._ensure_table()
+        count = 0
+        while (job := await self._claim()) is not None:
+            await self._run(job)
+            count += 1
+        return count
+
+    async def _work(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.run_pending()
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Job worker error")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval_seconds)
+            except TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        # Jobs left running by a crash are picked up by _claim() once their
+        # lease expires; ones still leased may belong to a live worker.
+        await self._ensure_table()
+        self._worker = asyncio.create_task(self._work())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.engine.dispose()
+
+    async def stats(self) -> dict:
+        """Job counts by status, for monitoring."""
+        await self._ensure_table()
+        async with self.engine.connect() as conn:
+            rows = await conn.execute(
+                select(jobs_table.c.status, func.count()).group_by(jobs_table.c.status),
+            )
+            return {status: count for status, count in rows}
+
+
+job_queue = JobQueue(
+    url=settings.job_queue_url,
+    poll_interval_seconds=settings.job_poll_interval_seconds,
+    max_attempts=settings.job_max_attempts,
+    retry_base_seconds=settings.job_retry_base_seconds,
+    lease_seconds=settings.job_lease_seconds,
+)
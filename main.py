@@ -1,63 +1,305 @@
+import re
+import secrets
+import time
 from contextlib import asynccontextmanager
 from typing import Annotated
 
-from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
 from fastapi.exception_handlers import (
     http_exception_handler,
     request_validation_exception_handler,
 )
 from fastapi.exceptions import RequestValidationError
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import defer, joinedload, selectinload
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
+from assets import AssetStaticFiles, ImmutableStaticFiles, asset_manifest, asset_url
+from auth import password_pool
+from cache import page_cache
+from image_utils import image_engine
+from jobs import job_queue
+import metrics
+import slow_queries
 from models import User, Post
-from database import Base, engine, get_db
+from config import settings
+from database import Base, engine, get_read_db, pool_stats, read_router, replica_engines
+from etags import (
+    has_conditional_headers,
+    is_not_modified,
+    make_validators,
+    not_modified_response,
+    post_version_query,
+    post_versions,
+    user_versions,
+    validator_headers,
+)
+from pagination import PostStream, keyset_page
+from profiling import ProfilingMiddleware, request_profiler
+from query_budget import check_query_budget, query_budget
 from routers import users, posts
+from streaming import StreamingTemplates
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     # Startup
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await job_queue.start()
     yield
     # Shutdown
+    await job_queue.stop()
+    await slow_queries.slow_query_log.drain()
+    slow_queries.slow_query_log.close()
+    password_pool.shutdown()
+    image_engine.shutdown()
     await engine.dispose()
+    for replica_engine in replica_engines:
+        await replica_engine.dispose()
 
 
 app = FastAPI(lifespan=lifespan)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/media", StaticFiles(directory="media"), name="media")
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        read_router.mark_write(response)
+    return response
+
+
+# Multipart framing around the file part of a picture upload
+UPLOAD_FORM_OVERHEAD_BYTES = 16 * 1024
+PICTURE_UPLOAD_PATH = re.compile(r"^/api/users/\d+/picture$")
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Refuse declared-oversized uploads before the multipart body is parsed;
+    # the endpoint still enforces the limit for chunked bodies.
+    if request.method == "PATCH" and PICTURE_UPLOAD_PATH.match(request.url.path):
+        content_length = request.headers.get("content-length", "")
+        limit = settings.max_upload_size_bytes + UPLOAD_FORM_OVERHEAD_BYTES
+        if content_length.isdigit() and int(content_length) > limit:
+            return JSONResponse(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                content={
+                    "detail": f"File too large. Maximum size is {settings.max_upload_size_bytes // (1024 * 1024)}MB",
+                },
+            )
+    return await call_next(request)
+
+
+# Registered last so it wraps the other middleware and times the whole request
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    stats = metrics.RequestStats(request.scope)
+    # Also read by the profiling middleware for the request's SQL timeline
+    request.state.request_stats = stats
+    token = metrics.current_request.set(stats)
+    try:
+        response = await call_next(request)
+    except Exception:
+        metrics.record_request(stats, request.method, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        raise
+    finally:
+        metrics.current_request.reset(token)
+
+    # Streamed pages keep querying while the body is sent, so the request
+    # is recorded once the last chunk has gone out.
+    body = response.body_iterator
+
+    async def record_after_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            metrics.record_request(stats, request.method, response.status_code)
+        check_query_budget(stats, request.method)
+
+    response.body_iterator = record_after_body()
+    return response
+
+
+# Off by default; when it is off the middleware is not installed at all
+if request_profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+
+
+app.mount("/static", AssetStaticFiles(manifest=asset_manifest), name="static")
+# Uploaded pictures get a new random name each time, so they never change
+app.mount("/media", ImmutableStaticFiles(directory="media"), name="media")
 
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = asset_url
+# Listing pages stream as they render; see streaming.py
+streaming_templates = StreamingTemplates(directory="templates")
+streaming_templates.env.globals["asset_url"] = asset_url
 
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(posts.router, prefix="/api/posts", tags=["posts"])
 
+
+## Rendered Page Cache
+# Pages are keyed by route, base URL (url_for renders absolute links) and
+# parameters, and tagged with the posts and users they show so that the
+# write endpoints in routers/ can drop exactly the pages they affect.
+def _page_key(request: Request, route: str, *params) -> tuple:
+    return (route, str(request.base_url), *params)
+
+
+def _cached_page(request: Request, key: tuple) -> Response | None:
+    # The cache is per process: another worker may hold a page from before
+    # this client's write, so a client that wrote recently gets a fresh one
+    if read_router.wrote_recently(request):
+        return None
+    entry = page_cache.get(key)
+    if entry is None:
+        return None
+    etag, last_modified, body = entry
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    return HTMLResponse(body, headers=validator_headers(etag, last_modified))
+
+
+def _store_page(
+    db: AsyncSession,
+    key: tuple,
+    response: Response,
+    validators: tuple,
+    tags: set[str],
+    generation: int,
+) -> Response:
+    response.headers.update(validator_headers(*validators))
+    _cache_body(db, key, response.body, validators, tags, generation)
+    return response
+
+
+def _cache_body(
+    db: AsyncSession,
+    key: tuple,
+    body: bytes,
+    validators: tuple,
+    tags: set[str],
+    generation: int,
+) -> None:
+    # A replica may not have caught up with a write we have just seen
+    replica_may_lag = db.info.get("replica") and (
+        time.monotonic() - page_cache.last_invalidated
+        < read_router.read_your_writes_seconds
+    )
+    if not replica_may_lag:
+        page_cache.set(key, (*validators, body), tags=tags, generation=generation)
+
+
+def _stream_page(
+    request: Request,
+    name: str,
+    context: dict,
+    db: AsyncSession,
+    key: tuple,
+    validators: tuple,
+    tags: set[str],
+    generation: int,
+) -> Response:
+    """Stream a listing page, caching it once it has been sent in full.
+
+    Pages over page_cache_max_body_bytes are sent but not cached, so a long
+    listing is never held in memory whole.
+
+    The validators come from version rows read up front, since the headers
+    go out before the posts are fetched.
+    """
+    return streaming_templates.TemplateResponse(
+        request,
+        name,
+        context,
+        headers=validator_headers(*validators),
+        on_complete=lambda body: _cache_body(db, key, body, validators, tags, generation),
+        on_complete_max_bytes=settings.page_cache_max_body_bytes,
+    )
+
+
+# Listing pages show the excerpt; only post_page loads the content
+def _post_listing_query():
+    return select(Post).options(
+        joinedload(Post.author), defer(Post.content, raiseload=True),
+    )
+
+
+def _post_tags(version_rows) -> set[str]:
+    """Tags for post_version_query() rows."""
+    tags = set()
+    for post_id, _, _, author_id, _, _ in version_rows:
+        tags.add(f"post:{post_id}")
+        tags.add(f"user:{author_id}")
+    return tags
+
+
 @app.get("/", include_in_schema=False, name="home")
 @app.get("/posts", include_in_schema=False, name="posts")
-async def home(request: Request, db: Annotated[AsyncSession, Depends(get_db)]):
-    result = await db.execute(
-        select(Post).options(selectinload(Post.author)).order_by(Post.date_posted.desc()),
+@query_budget(2)
+async def home(
+    request: Request,
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    cursor: str | None = None,
+):
+    key = _page_key(request, "home", cursor)
+    if cached := _cached_page(request, key):
+        return cached
+    generation = page_cache.generation
+    limit = settings.posts_page_size
+
+    result = await db.execute(keyset_page(post_version_query(), cursor, limit))
+    rows = result.all()
+    validators = make_validators(
+        "home", [*rows[:limit], (len(rows) > limit,)], collection=True,
     )
-    posts = result.scalars().all()
-    return templates.TemplateResponse(
+    if is_not_modified(request, *validators):
+        return not_modified_response(*validators)
+
+    # Keyset pages after the first never gain new posts, so only the
+    # first page depends on post creation.
+    tags = _post_tags(rows[:limit])
+    if cursor is None:
+        tags.add("feed:latest")
+    posts = PostStream(db, _post_listing_query(), cursor, limit)
+    return _stream_page(
         request,
         "home.html",
-        {"posts": posts, "title": "Home"},
+        {"posts": posts, "cursor": cursor, "title": "Home"},
+        db,
+        key,
+        validators,
+        tags,
+        generation,
     )
 
 
 @app.get("/posts/{post_id}", include_in_schema=False)
+@query_budget(3)
 async def post_page(
     request: Request,
     post_id: int,
-    db: Annotated[AsyncSession, Depends(get_db)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
 ):
+    key = _page_key(request, "post_page", post_id)
+    if cached := _cached_page(request, key):
+        return cached
+    generation = page_cache.generation
+
+    if has_conditional_headers(request):
+        result = await db.execute(post_version_query().where(Post.id == post_id))
+        row = result.first()
+        if row:
+            validators = make_validators("post_page", [row])
+            if is_not_modified(request, *validators):
+                return not_modified_response(*validators)
+
     result = await db.execute(
         select(Post)
         .options(selectinload(Post.author))
@@ -66,20 +308,29 @@ async def post_page(
     post = result.scalars().first()
     if post:
         title = post.title[:50]
-        return templates.TemplateResponse(
+        response = templates.TemplateResponse(
             request,
             "post.html",
             {"post": post, "title": title},
         )
+        versions = post_versions(post)
+        validators = make_validators("post_page", [versions])
+        return _store_page(db, key, response, validators, _post_tags([versions]), generation)
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
 
 
 @app.get("/users/{user_id}/posts", include_in_schema=False, name="user_posts")
+@query_budget(3)
 async def user_posts_page(
     request: Request,
     user_id: int,
-    db: Annotated[AsyncSession, Depends(get_db)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
 ):
+    key = _page_key(request, "user_posts", user_id)
+    if cached := _cached_page(request, key):
+        return cached
+    generation = page_cache.generation
+
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalars().first()
     if not user:
@@ -87,17 +338,93 @@ async def user_posts_page(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
+    order = (Post.date_posted.desc(), Post.id.desc())
     result = await db.execute(
-        select(Post)
-        .options(selectinload(Post.author))
-        .where(Post.user_id == user_id).order_by(Post.date_posted.desc()),
+        post_version_query().where(Post.user_id == user_id).order_by(*order),
     )
-    posts = result.scalars().all()
-    return templates.TemplateResponse(
+    validators = make_validators(
+        "user_posts", [user_versions(user), *result.all()], collection=True,
+    )
+    if is_not_modified(request, *validators):
+        return not_modified_response(*validators)
+
+    posts = PostStream(
+        db, _post_listing_query().where(Post.user_id == user_id).order_by(*order),
+    )
+    return _stream_page(
         request,
         "user_posts.html",
         {"posts": posts, "user": user, "title": f"{user.username}'s Posts"},
+        db,
+        key,
+        validators,
+        {f"user:{user_id}", f"user_posts:{user_id}"},
+        generation,
+    )
+
+
+@app.get("/health/pool", include_in_schema=False)
+async def database_pool_stats():
+    return pool_stats()
+
+
+@app.get("/health/images", include_in_schema=False)
+async def image_engine_stats():
+    return image_engine.stats()
+
+
+@app.get("/health/jobs", include_in_schema=False)
+async def job_queue_stats():
+    return await job_queue.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    engines = {"primary": engine}
+    engines.update(
+        (f"replica{index}", replica_engine)
+        for index, replica_engine in enumerate(replica_engines)
     )
+    for name, stats_engine in engines.items():
+        stats = pool_stats(stats_engine)
+        for state in ("pool_size", "max_overflow", "checked_out", "checked_in", "overflow"):
+            if state in stats:
+                metrics.pool_connections.set(stats[state], name, state)
+        if "checkouts" in stats:
+            metrics.pool_checkouts.set(stats["checkouts"] - stats["timeouts"], name, "ok")
+            metrics.pool_checkouts.set(stats["timeouts"], name, "timeout")
+            metrics.pool_wait.set(stats["wait_seconds_total"], name)
+    for name, pool in (("argon2", password_pool), ("images", image_engine)):
+        stats = pool.stats()
+        metrics.worker_pool_jobs.set(stats["in_flight"], name, "in_flight")
+        metrics.worker_pool_jobs.set(stats["queued"], name, "queued")
+        metrics.worker_pool_rejected.set(stats["rejected"], name)
+    return PlainTextResponse(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+
+## Admin Endpoints
+def require_admin_token(request: Request) -> None:
+    # Hidden (404) unless ADMIN_TOKEN is configured and sent as X-Admin-Token
+    token = settings.admin_token
+    sent = request.headers.get("x-admin-token", "")
+    # Bytes, since compare_digest rejects str with non-ASCII characters
+    if token is None or not secrets.compare_digest(
+        sent.encode(), token.get_secret_value().encode(),
+    ):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+
+@app.get(
+    "/api/admin/slow-queries",
+    include_in_schema=False,
+    dependencies=[Depends(require_admin_token)],
+)
+async def slow_query_entries(limit: Annotated[int, Query(ge=1, le=500)] = 50):
+    slow_log = slow_queries.slow_query_log
+    return {
+        "threshold_seconds": slow_log.threshold_seconds,
+        "queries": await run_in_threadpool(slow_log.recent, limit),
+    }
 
 
 @app.get("/login", include_in_schema=False)
@@ -0,0 +1,247 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+# Seconds; covers a cached page (~1 ms) up to a stalled upload
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+## Metric Types
+# A tiny subset of the Prometheus client: enough for the text exposition
+# format without a dependency. Like the other in-process stats, these are
+# only updated from the event loop thread, so no lock is needed.
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, value: float, *labels) -> None:
+        """For totals counted elsewhere (pool stats), copied at scrape time."""
+        self.values[labels] = value
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Point-in-time values, set from the stats snapshots at scrape time."""
+
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (last is +Inf), sum]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels) -> int:
+        series = self.series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+## Registry
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time to produce a response, by route template.",
+    ("method", "route"),
+)
+http_requests = Counter(
+    "http_requests_total",
+    "Responses sent, by route template and status code.",
+    ("method", "route", "status"),
+)
+db_statements_per_request = Histogram(
+    "db_statements_per_request",
+    "SQL statements executed while handling one request.",
+    ("route",),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+db_statement_duration = Histogram(
+    "db_statement_duration_seconds",
+    "Time the driver spent on each SQL statement, by route template.",
+    ("route",),
+    buckets=QUERY_BUCKETS,
+)
+password_hash_duration = Histogram(
+    "password_hash_duration_seconds",
+    "argon2 hash or verify time, including the wait for a pool thread.",
+)
+image_processing_duration = Histogram(
+    "image_processing_duration_seconds",
+    "Profile image processing time: in the worker, and end to end.",
+    ("stage",),
+)
+pool_connections = Gauge(
+    "db_pool_connections",
+    "Connection pool size and usage.",
+    ("engine", "state"),
+)
+pool_checkouts = Counter(
+    "db_pool_checkouts_total",
+    "Connection checkouts, and those that timed out waiting.",
+    ("engine", "result"),
+)
+pool_wait = Counter(
+    "db_pool_wait_seconds_total",
+    "Total time spent waiting for a pooled connection.",
+    ("engine",),
+)
+worker_pool_jobs = Gauge(
+    "worker_pool_jobs",
+    "Jobs running or waiting in the argon2 and image worker pools.",
+    ("pool", "state"),
+)
+worker_pool_rejected = Counter(
+    "worker_pool_rejected_total",
+    "Jobs refused with 503 because a worker pool was full.",
+    ("pool",),
+)
+
+REGISTRY: list[_Metric] = [
+    http_request_duration,
+    http_requests,
+    db_statements_per_request,
+    db_statement_duration,
+    password_hash_duration,
+    image_processing_duration,
+    pool_connections,
+    pool_checkouts,
+    pool_wait,
+    worker_pool_jobs,
+    worker_pool_rejected,
+]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+## Per-request Recording
+# The metrics middleware puts a RequestStats in the context; the engine
+# events in database.py add to it. Statements run outside a request (startup,
+# background jobs) are recorded under the "background" route.
+def route_label(scope: dict) -> str:
+    """The matched route template, so that ids in paths do not explode the series."""
+    route = scope.get("route")
+    if route is None:
+        # Mounted apps (static files) only leave their prefix behind
+        mount = scope.get("root_path", "")[len(scope.get("app_root_path", "")):]
+        return f"{mount}/{{path}}" if mount else "unmatched"
+    # Routes of an included router only know their own part of the path
+    # (e.g. "/{post_id}"); take the prefix from the request path
+    template = getattr(route, "path", "")
+    segments = scope["path"].rstrip("/").split("/")
+    prefix = "/".join(segments[:len(segments) - template.count("/")])
+    return prefix + template
+
+
+class StatementRecord(NamedTuple):
+    statement: str
+    started: float  # time.perf_counter()
+    seconds: float
+
+
+@dataclass
+class RequestStats:
+    scope: dict
+    started: float = field(default_factory=time.perf_counter)
+    # Every statement in order, for query budgets and profiles
+    statements: list[StatementRecord] = field(default_factory=list)
+    db_seconds: float = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope)
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def record_statement(statement: str, started: float, seconds: float) -> None:
+    stats = current_request.get()
+    if stats is None:
+        db_statement_duration.observe(seconds, "background")
+        return
+    stats.statements.append(StatementRecord(statement, started, seconds))
+    stats.db_seconds += seconds
+    db_statement_duration.observe(seconds, stats.route)
+
+
+def record_request(stats: RequestStats, method: str, status_code: int) -> None:
+    route = stats.route
+    http_request_duration.observe(time.perf_counter() - stats.started, method, route)
+    http_requests.inc(method, route, str(status_code))
+    db_statements_per_request.observe(len(stats.statements), route)
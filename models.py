@@ -2,14 +2,38 @@ from __future__ import annotations
 
 from datetime import  datetime
 from sqlalchemy.sql import func
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import DDL, JSON, DateTime, ForeignKey, Index, Integer, String, Text, event, literal_column
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from database import Base
 
+# SQLite fills func.now() defaults with CURRENT_TIMESTAMP (whole seconds), so
+# bound values must use the same text format for comparisons to work.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(truncate_microseconds=True), "sqlite",
+)
+
+
+def version_column() -> Mapped[int]:
+    """Row version, bumped by every UPDATE. Used to build ETags."""
+    return mapped_column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default="1",
+        onupdate=literal_column("version", Integer) + 1,
+    )
+
+
+def updated_at_column() -> Mapped[datetime]:
+    return mapped_column(Timestamp, default=func.now(), onupdate=func.now())
+
 
 class User(Base):
     __tablename__ = "users"
+    # Fetch version/updated_at with RETURNING instead of expiring them
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     username: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
@@ -20,35 +44,164 @@ class User(Base):
         nullable=True,
         default=None,
     )
+    # Sizes stored for image_file, e.g. [64, 128, 300]; None for older
+    # single-file uploads
+    image_sizes: Mapped[list[int] | None] = mapped_column(
+        JSON,
+        nullable=True,
+        default=None,
+    )
+    version: Mapped[int] = version_column()
+    updated_at: Mapped[datetime] = updated_at_column()
 
     # Use string-based class names in relationships (e.g., "Post", "User")
     # as a SQLAlchemy best practice to avoid import order issues
     # and forward-reference problems when models reference each other.
-    posts: Mapped[list["Post"]] = relationship(back_populates="author", cascade="all, delete-orphan")
+    # passive_deletes: the posts.user_id FK is ON DELETE CASCADE, so deleting a
+    # user is left to the database instead of loading every post first.
+    posts: Mapped[list["Post"]] = relationship(
+        back_populates="author",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
     @property
     def image_path(self) -> str:
-        if self.image_file:
-            return f"/media/profile_pics/{self.image_file}"
-        return "/static/profile_pics/default.jpg"
+        return profile_image_path(self.image_file)
+
+    def image_srcset_for(self, ext: str) -> str | None:
+        """srcset listing every stored size of the picture in one format."""
+        return profile_image_srcset(self.image_file, self.image_sizes, ext)
+
+    @property
+    def image_srcset(self) -> str | None:
+        return self.image_srcset_for("webp")
+
+
+## Profile Image URLs
+# Plain functions so that column-only queries can build the same URLs
+# without loading User objects.
+def profile_image_path(image_file: str | None) -> str:
+    if image_file:
+        return f"/media/profile_pics/{image_file}"
+    return "/static/profile_pics/default.jpg"
+
+
+def profile_image_srcset(
+    image_file: str | None,
+    image_sizes: list[int] | None,
+    ext: str,
+) -> str | None:
+    if not image_file or not image_sizes:
+        return None
+    # image_file is <stem>_<largest>.jpg, see image_utils.process_profile_image
+    stem = image_file.rsplit("_", 1)[0]
+    return ", ".join(
+        f"/media/profile_pics/{stem}_{size}.{ext} {size}w"
+        for size in image_sizes
+    )
+
+
+## Post Excerpts
+# Listing pages show the excerpt and leave the content column unread.
+EXCERPT_LENGTH = 200
+
+
+def make_excerpt(content: str) -> str:
+    """The start of ``content`` on one line, cut at a word boundary."""
+    text = " ".join(content.split())
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text[:EXCERPT_LENGTH]
+    if text[EXCERPT_LENGTH] != " " and " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" .,;:!?-") + "\u2026"
+
+
+def _default_excerpt(context) -> str:
+    return make_excerpt(context.get_current_parameters()["content"])
 
 
 class Post(Base):
     __tablename__ = "posts"
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     title: Mapped[str] = mapped_column(String(100), nullable=False)
     content: Mapped[str] = mapped_column(Text, nullable=False)
+    # Filled in from content on INSERT; routers/posts.py recomputes it when
+    # an update changes the content.
+    excerpt: Mapped[str] = mapped_column(
+        String(EXCERPT_LENGTH + 1),
+        nullable=False,
+        default=_default_excerpt,
+    )
+    # Indexed through ix_posts_user_id_date_posted below
     user_id: Mapped[int] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE"),
         nullable=False,
-        index=True,
     )
     date_posted: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
+        Timestamp,
         server_default=func.now(),
     )
+    version: Mapped[int] = version_column()
+    updated_at: Mapped[datetime] = updated_at_column()
 
     # String reference ("User" not User) prevents circular import / early evaluation issues
     # when SQLAlchemy resolves relationships during model loading.
-    author: Mapped["User"] = relationship(back_populates="posts")
\ No newline at end of file
+    author: Mapped["User"] = relationship(back_populates="posts")
+
+
+# Case-insensitive lookups in routers/users.py filter on lower(username/email)
+Index("ix_users_username_lower", func.lower(User.username))
+Index("ix_users_email_lower", func.lower(User.email))
+
+# Feeds sort newest first, globally and per author
+Index("ix_posts_date_posted", Post.date_posted.desc())
+Index("ix_posts_user_id_date_posted", Post.user_id, Post.date_posted.desc())
+
+
+## Full-text Search
+# Kept in sync by the database itself, so every write path (single, bulk,
+# UPDATE ... RETURNING, cascaded deletes) updates the index incrementally.
+# Postgres: a generated tsvector column with a GIN index. SQLite: an FTS5
+# table over posts, maintained by triggers. See search.py for the queries.
+POSTS_SEARCH_DDL = {
+    "postgresql": [
+        "ALTER TABLE posts ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', title), 'A') || "
+        "setweight(to_tsvector('english', content), 'B')) STORED",
+        "CREATE INDEX ix_posts_search_vector ON posts USING gin (search_vector)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE posts_fts USING fts5("
+        "title, content, content='posts', content_rowid='id', "
+        "tokenize='porter unicode61')",
+        "CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN "
+        "INSERT INTO posts_fts (rowid, title, content) "
+        "VALUES (new.id, new.title, new.content); END",
+        "CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN "
+        "INSERT INTO posts_fts (posts_fts, rowid, title, content) "
+        "VALUES ('delete', old.id, old.title, old.content); END",
+        "CREATE TRIGGER posts_fts_update AFTER UPDATE OF title, content ON posts BEGIN "
+        "INSERT INTO posts_fts (posts_fts, rowid, title, content) "
+        "VALUES ('delete', old.id, old.title, old.content); "
+        "INSERT INTO posts_fts (rowid, title, content) "
+        "VALUES (new.id, new.title, new.content); END",
+    ],
+}
+
+for dialect_name, statements in POSTS_SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(
+            Post.__table__,
+            "after_create",
+            DDL(statement).execute_if(dialect=dialect_name),
+        )
+# The triggers go with the posts table; the FTS table has to be dropped itself
+event.listen(
+    Post.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS posts_fts").execute_if(dialect="sqlite"),
+)
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import Row, Select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Post
+
+
+## Cursor Encoding
+# A cursor is the sort key of the last item on a page, packed into URL-safe
+# base64 so clients treat it as opaque.
+def pack_cursor(payload: dict) -> str:
+    data = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def unpack_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError) as err:
+        raise _invalid_cursor() from err
+    if not isinstance(payload, dict):
+        raise _invalid_cursor()
+    return payload
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor",
+    )
+
+
+def encode_cursor(post: Post | Row) -> str:
+    """Cursor for the (date_posted, id) feed order."""
+    return pack_cursor({"d": post.date_posted.isoformat(), "id": post.id})
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    payload = unpack_cursor(cursor)
+    try:
+        return datetime.fromisoformat(payload["d"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError) as err:
+        raise _invalid_cursor() from err
+
+
+## Keyset Pagination
+def keyset_page(query: Select, cursor: str | None, limit: int) -> Select:
+    """Restrict a posts query to one page, newest first.
+
+    One extra row is selected so callers can tell whether another page follows.
+    """
+    query = query.order_by(Post.date_posted.desc(), Post.id.desc())
+    if cursor:
+        date_posted, post_id = decode_cursor(cursor)
+        query = query.where(
+            or_(
+                Post.date_posted < date_posted,
+                and_(Post.date_posted == date_posted, Post.id < post_id),
+            ),
+        )
+    return query.limit(limit + 1)
+
+
+def _split_page(items: list, limit: int) -> tuple[list, str | None]:
+    if len(items) > limit:
+        items = items[:limit]
+        return items, encode_cursor(items[-1])
+    return items, None
+
+
+async def paginate_posts(
+    db: AsyncSession,
+    query: Select,
+    cursor: str | None,
+    limit: int,
+) -> tuple[list[Post], str | None]:
+    """Return one page of posts, newest first, and the cursor for the next page."""
+    result = await db.execute(keyset_page(query, cursor, limit))
+    return _split_page(list(result.scalars().all()), limit)
+
+
+async def paginate_post_rows(
+    db: AsyncSession,
+    query: Select,
+    cursor: str | None,
+    limit: int,
+) -> tuple[list[Row], str | None]:
+    """paginate_posts() for column queries; rows need ``id`` and ``date_posted``."""
+    result = await db.execute(keyset_page(query, cursor, limit))
+    return _split_page(list(result.all()), limit)
+
+
+## Streamed Pages
+class PostStream:
+    """Posts fetched as they are iterated, for streamed pages.
+
+    The query runs on first iteration, so whatever a template renders before
+    its loop is sent without waiting for it. With ``limit`` this is one
+    keyset page, and ``next_cursor`` is set once iteration has finished.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        query: Select,
+        cursor: str | None = None,
+        limit: int | None = None,
+        batch_size: int = 100,
+    ):
+        self.db = db
+        self.query = query
+        self.cursor = cursor
+        self.limit = limit
+        self.batch_size = batch_size
+        self.next_cursor: str | None = None
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        query = self.query
+        if self.limit is not None:
+            query = keyset_page(query, self.cursor, self.limit)
+        result = await self.db.stream_scalars(
+            query.execution_options(yield_per=self.batch_size),
+        )
+        try:
+            count, last = 0, None
+            async for post in result:
+                if count == self.limit:
+                    self.next_cursor = encode_cursor(last)
+                    break
+                yield post
+                count, last = count + 1, post
+        finally:
+            await result.close()
@@ -0,0 +1,190 @@
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from metrics import RequestStats, route_label
+
+PROFILE_HEADER = b"x-profile-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+
+## Stack Sampling
+# A sampling profiler instead of cProfile: the event loop only pays for the
+# sampler briefly holding the GIL, instead of a hook on every call, and
+# concurrent requests are not distorted by tracing overhead. Stacks are
+# written in the collapsed format ("a;b;c 12") read by flamegraph.pl,
+# speedscope and most flamegraph viewers.
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """Record the stack of one thread every ``interval_seconds`` from a helper thread."""
+
+    def __init__(self, thread_id: int, interval_seconds: float):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter[str]:
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+
+## Request Profiler
+class RequestProfiler:
+    """Decide which requests to profile and store what was recorded.
+
+    A request is profiled when it carries the configured X-Profile-Token or
+    is picked at ``sample_rate``. One request is profiled at a time; others
+    that would qualify meanwhile run unprofiled. Each profile is saved as
+    ``<id>.collapsed`` (stack samples) and ``<id>.json`` (request details and
+    its SQL timeline), and the id is returned in an X-Profile-Id header.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        token: str | None = None,
+        sample_rate: float = 0.0,
+        interval_seconds: float = 0.005,
+        max_kept: int = 100,
+    ):
+        self.directory = Path(directory)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval_seconds = interval_seconds
+        self.max_kept = max_kept
+        self._busy = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token) or self.sample_rate > 0
+
+    def wanted(self, scope: Scope) -> bool:
+        if self._busy:
+            return False
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return secrets.compare_digest(value, self.token.encode())
+        return random.random() < self.sample_rate
+
+    async def profile(self, app: ASGIApp, scope: Scope, receive: Receive, send: Send) -> None:
+        now = time.time_ns()
+        profile_id = (
+            f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now // 10**9))}"
+            f"-{now % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+        )
+        status_code = None
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (PROFILE_ID_HEADER, profile_id.encode()),
+                ]
+            await send(message)
+
+        self._busy = True
+        sampler = StackSampler(threading.get_ident(), self.interval_seconds)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await app(scope, receive, send_with_id)
+        finally:
+            stacks = sampler.stop()
+            elapsed = time.perf_counter() - started
+            self._busy = False
+            stats = scope.get("state", {}).get("request_stats")
+            details = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route_label(scope),
+                "status_code": status_code,
+                "duration_ms": elapsed * 1000,
+                "interval_ms": self.interval_seconds * 1000,
+                "samples": sum(stacks.values()),
+                "sql": self._sql_timeline(stats, started),
+            }
+            await run_in_threadpool(self._save, profile_id, stacks, details)
+
+    @staticmethod
+    def _sql_timeline(stats: RequestStats | None, started: float) -> list[dict]:
+        if stats is None:
+            return []
+        return [
+            {
+                "start_ms": (record.started - started) * 1000,
+                "duration_ms": record.seconds * 1000,
+                "statement": record.statement,
+            }
+            for record in stats.statements
+        ]
+
+    def _save(self, profile_id: str, stacks: Counter[str], details: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{profile_id}.collapsed").write_text(
+            "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+        )
+        (self.directory / f"{profile_id}.json").write_text(json.dumps(details, indent=2))
+        # Ids start with a timestamp, so name order is age order
+        for old in sorted(self.directory.glob("*.json"))[:-self.max_kept]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".collapsed").unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware, so unprofiled requests pay one check and no extra task.
+
+    main.py only installs it when profiling is configured.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.profiler.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        await self.profiler.profile(self.app, scope, receive, send)
+
+
+request_profiler = RequestProfiler(
+    directory=Path(settings.profile_dir),
+    token=settings.profile_token.get_secret_value() if settings.profile_token else None,
+    sample_rate=settings.profile_sample_rate,
+    interval_seconds=settings.profile_interval_seconds,
+    max_kept=settings.profile_max_kept,
+)
@@ -0,0 +1,52 @@
+import logging
+from collections.abc import Callable
+
+from config import settings
+from metrics import RequestStats
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more SQL statements than its endpoint allows."""
+
+
+## Declaring Budgets
+# Put @query_budget(n) under the route decorator. A lazy load or per-row
+# query added later (an N+1) pushes the count past n on any request with
+# more than a row or two, which fails the tests instead of reaching production.
+def query_budget(max_statements: int) -> Callable:
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.query_budget = max_statements
+        return endpoint
+
+    return decorator
+
+
+def budget_for(scope: dict) -> int | None:
+    endpoint = getattr(scope.get("route"), "endpoint", None)
+    return getattr(endpoint, "query_budget", None)
+
+
+## Checking Requests
+def check_query_budget(stats: RequestStats, method: str) -> None:
+    """Called by the metrics middleware once the response is ready.
+
+    Logs a warning listing the statements, or raises QueryBudgetExceeded
+    when settings.query_budget_strict is on (as it is in the tests).
+    """
+    budget = budget_for(stats.scope)
+    if budget is None or len(stats.statements) <= budget:
+        return
+
+    statements = "\n".join(
+        f"  {number}. {' '.join(record.statement.split())}"
+        for number, record in enumerate(stats.statements, start=1)
+    )
+    message = (
+        f"{method} {stats.scope['path']} ({stats.route}) ran "
+        f"{len(stats.statements)} SQL statements, budget is {budget}:\n{statements}"
+    )
+    if settings.query_budget_strict:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -1,23 +1,93 @@
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from auth import CurrentUser
-from models import User, Post
-from database import get_db
-from schemas import PostCreate, PostResponse, PostUpdate
+from cache import page_cache
+from models import User, Post, make_excerpt
+from database import get_db, get_read_db
+from config import settings
+from etags import (
+    has_conditional_headers,
+    is_not_modified,
+    make_validators,
+    not_modified_response,
+    post_version_query,
+    post_versions,
+    validator_headers,
+)
+from pagination import paginate_post_rows
+from query_budget import query_budget
+from schemas import PostCreate, PostPage, PostResponse, PostUpdate
+from search import search_posts
+from serializers import FastJSONResponse, dumps, post_row_to_dict, post_rows_query
 
 router = APIRouter()
 
-@router.get("", response_model=list[PostResponse])
-async def get_posts(db: Annotated[AsyncSession, Depends(get_db)]):
-    result = await db.execute(
-        select(Post).options(selectinload(Post.author)).order_by(Post.date_posted.desc()),
-    )
-    posts = result.scalars().all()
-    return posts
+@router.get("", response_model=PostPage)
+@query_budget(1)
+async def get_posts(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    cursor: str | None = None,
+    limit: Annotated[
+        int, Query(ge=1, le=settings.max_posts_page_size)
+    ] = settings.posts_page_size,
+):
+    rows, next_cursor = await paginate_post_rows(db, post_rows_query(), cursor, limit)
+    return FastJSONResponse({
+        "posts": [post_row_to_dict(row) for row in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+@router.get("/search", response_model=PostPage)
+@query_budget(1)
+async def search(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    cursor: str | None = None,
+    limit: Annotated[
+        int, Query(ge=1, le=settings.max_posts_page_size)
+    ] = settings.posts_page_size,
+):
+    rows, next_cursor = await search_posts(db, q, cursor, limit)
+    return FastJSONResponse({
+        "posts": [post_row_to_dict(row) for row in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+## NDJSON Export
+# Rows come from a server-side cursor a batch at a time and are written out
+# as they arrive, so memory use does not grow with the size of the table.
+@router.get("/export", response_class=StreamingResponse)
+async def export_posts(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    user_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+):
+    query = post_rows_query().order_by(Post.id)
+    if user_id is not None:
+        query = query.where(Post.user_id == user_id)
+    if date_from is not None:
+        query = query.where(Post.date_posted >= date_from)
+    if date_to is not None:
+        query = query.where(Post.date_posted < date_to)
+
+    batch_size = settings.export_batch_size
+
+    async def lines():
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield b"".join(dumps(post_row_to_dict(row)) + b"\n" for row in rows)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @router.post(
@@ -25,6 +95,7 @@ async def get_posts(db: Annotated[AsyncSession, Depends(get_db)]):
     response_model=PostResponse,
     status_code=status.HTTP_201_CREATED,
 )
+@query_budget(3)
 async def create_post(post: PostCreate, 
                       current_user:CurrentUser, 
                       db: Annotated[AsyncSession, 
@@ -36,12 +107,66 @@ async def create_post(post: PostCreate,
     )
     db.add(new_post)
     await db.commit()
+    page_cache.invalidate("feed:latest", f"user_posts:{current_user.id}")
     await db.refresh(new_post, attribute_names=["author"])
     return new_post
 
 
+@router.post(
+    "/bulk",
+    response_model=list[PostResponse],
+    status_code=status.HTTP_201_CREATED,
+)
+@query_budget(2)
+async def create_posts_bulk(
+    posts: Annotated[
+        list[PostCreate],
+        Body(min_length=1, max_length=settings.max_bulk_posts),
+    ],
+    current_user: CurrentUser,
+    db: Annotated[AsyncSession, Depends(get_db)],
+):
+    # One multi-row INSERT ... RETURNING (split by SQLAlchemy only past the
+    # driver's parameter limit) and one commit for the whole list.
+    # RETURNING order is not guaranteed on Postgres, so SQLAlchemy is asked to
+    # match rows to the request there. On SQLite that would fall back to a
+    # statement per row, and ids are handed out in VALUES order, so sorting
+    # by id is enough.
+    on_sqlite = db.get_bind().dialect.name == "sqlite"
+    result = await db.execute(
+        insert(Post).returning(Post, sort_by_parameter_order=not on_sqlite),
+        [
+            {"title": post.title, "content": post.content, "user_id": current_user.id}
+            for post in posts
+        ],
+    )
+    new_posts = list(result.scalars().all())
+    if on_sqlite:
+        new_posts.sort(key=lambda post: post.id)
+    await db.commit()
+    page_cache.invalidate("feed:latest", f"user_posts:{current_user.id}")
+    for new_post in new_posts:
+        set_committed_value(new_post, "author", current_user)
+    return new_posts
+
+
 @router.get("/{post_id}", response_model=PostResponse)
-async def get_post(post_id: int, db: Annotated[AsyncSession, Depends(get_db)]):
+@query_budget(3)
+async def get_post(
+    post_id: int,
+    request: Request,
+    response: Response,
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+):
+    # Answer revalidations from the version columns alone
+    if has_conditional_headers(request):
+        result = await db.execute(post_version_query().where(Post.id == post_id))
+        row = result.first()
+        if row:
+            etag, last_modified = make_validators("post", [row])
+            if is_not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+
     result = await db.execute(
         select(Post)
         .options(selectinload(Post.author))
@@ -49,87 +174,100 @@ async def get_post(post_id: int, db: Annotated[AsyncSession, Depends(get_db)]):
     )
     post = result.scalars().first()
     if post:
+        etag, last_modified = make_validators("post", [post_versions(post)])
+        response.headers.update(validator_headers(etag, last_modified))
         return post
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
 
 
-@router.put("/{post_id}", response_model=PostResponse)
-async def update_post_full(
-    post_id: int,
-    current_user:CurrentUser,
-    post_data: PostCreate,
-    db: Annotated[AsyncSession, Depends(get_db)],
-):
-    result = await db.execute(select(Post).where(Post.id == post_id))
-    post = result.scalars().first()
-    if not post:
-        raise HTTPException(
+## Owner-scoped Writes
+# The ownership check lives in the WHERE clause, so the happy path is a single
+# UPDATE/DELETE ... RETURNING. Only when no row matches do we look again to
+# tell a missing post (404) from someone else's post (403).
+async def _post_miss(db: AsyncSession, post_id: int, action: str) -> HTTPException:
+    exists = await db.scalar(select(Post.id).where(Post.id == post_id))
+    if exists is None:
+        return HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Post not found",
         )
-    if post.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorised to update this post",
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail=f"Not authorised to {action} this post",
+    )
+
+
+async def _update_owned_post(
+    db: AsyncSession,
+    post_id: int,
+    current_user: User,
+    values: dict,
+) -> Post:
+    owned = (Post.id == post_id, Post.user_id == current_user.id)
+    if "content" in values:
+        values["excerpt"] = make_excerpt(values["content"])
+    if values:
+        result = await db.execute(
+            update(Post).where(*owned).values(**values).returning(Post),
         )
-    
-    post.title = post_data.title
-    post.content = post_data.content
+    else:
+        result = await db.execute(select(Post).where(*owned))
+    post = result.scalars().first()
+    if not post:
+        raise await _post_miss(db, post_id, "update")
 
     await db.commit()
-    await db.refresh(post, attribute_names=["author"])
+    page_cache.invalidate(f"post:{post.id}", f"user_posts:{post.user_id}")
+    # The author is the current user, who is already loaded
+    set_committed_value(post, "author", current_user)
     return post
 
 
+@router.put("/{post_id}", response_model=PostResponse)
+@query_budget(3)
+async def update_post_full(
+    post_id: int,
+    current_user:CurrentUser,
+    post_data: PostCreate,
+    db: Annotated[AsyncSession, Depends(get_db)],
+):
+    return await _update_owned_post(
+        db,
+        post_id,
+        current_user,
+        {"title": post_data.title, "content": post_data.content},
+    )
+
+
 @router.patch("/{post_id}", response_model=PostResponse)
+@query_budget(3)
 async def update_post_partial(
     post_id: int,
     post_data: PostUpdate,
     current_user: CurrentUser,
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    result = await db.execute(select(Post).where(Post.id == post_id))
-    post = result.scalars().first()
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Post not found",
-        )
-
-    if post.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorised to update this post",
-        )
-
-    update_data = post_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(post, field, value)
-
-    await db.commit()
-    await db.refresh(post, attribute_names=["author"])
-    return post
+    return await _update_owned_post(
+        db,
+        post_id,
+        current_user,
+        post_data.model_dump(exclude_unset=True),
+    )
 
 
 @router.delete("/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(3)
 async def delete_post(post_id: int, 
                       current_user:CurrentUser, 
                       db: Annotated[AsyncSession, 
                       Depends(get_db)]):
-    result = await db.execute(select(Post).where(Post.id == post_id))
-    post = result.scalars().first()
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Post not found",
-        )
-    
-    if post.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorised to delete this post",
-        )
-    
-    await db.delete(post)
-    await db.commit()
+    result = await db.execute(
+        delete(Post)
+        .where(Post.id == post_id, Post.user_id == current_user.id)
+        .returning(Post.id),
+    )
+    if result.first() is None:
+        raise await _post_miss(db, post_id, "delete")
 
+    await db.commit()
+    page_cache.invalidate(f"post:{post_id}", f"user_posts:{current_user.id}")
@@ -1,27 +1,65 @@
+import os
+import tempfile
+from pathlib import Path
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    status,
+    UploadFile,
+)
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import select, func #func for case insensitive SQL queries
+from sqlalchemy import delete, select, func #func for case insensitive SQL queries
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 from PIL import UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
 from models import User, Post
-from database import get_db
+from database import get_db, get_read_db
 from schemas import PostResponse, UserCreate, UserUpdate, UserPrivate, UserPublic, Token
 from datetime import timedelta
 from auth import (
     create_access_token,
     hash_password,
     CurrentUser,
+    invalidate_user,
+    password_pool,
     verify_password,
 )
-from starlette.concurrency import run_in_threadpool
-from image_utils import process_profile_image, delete_profile_image
+from cache import page_cache
+from etags import (
+    is_not_modified,
+    make_validators,
+    not_modified_response,
+    post_version_query,
+    validator_headers,
+)
+from image_utils import delete_profile_image, image_engine, sniff_image_type
+from jobs import job_queue
+from query_budget import query_budget
+from serializers import FastJSONResponse, post_row_to_dict, post_row_versions, post_rows_query
 from config import settings
 
 router = APIRouter()
 
+# Idempotent, so a retried job after a partial delete is harmless
+job_queue.register("delete_profile_image", delete_profile_image)
+
+INVALID_IMAGE_DETAIL = "Invalid image file. Please upload a valid image (JPEG, PNG, GIF, WebP)."
+
+
+async def _fresh_user(db: AsyncSession, user_id: int) -> User | None:
+    # CurrentUser may be built from this worker's user_cache, which writes
+    # handled by other workers do not invalidate. Writes act on the row as
+    # it is now; populate_existing overwrites the cached instance that is
+    # already in the session's identity map.
+    result = await db.execute(
+        select(User).where(User.id == user_id).execution_options(populate_existing=True),
+    )
+    return result.scalars().first()
+
 @router.post(
     "",
     response_model=UserPrivate,
@@ -51,7 +89,7 @@ async def create_user(user: UserCreate, db: Annotated[AsyncSession, Depends(get_
     new_user = User(
         username=user.username,
         email=user.email.lower(),  #store emails in lower case
-        password_hash = hash_password(user.password),
+        password_hash = await password_pool.run(hash_password, user.password),
     )
 
     db.add(new_user)
@@ -76,7 +114,9 @@ async def login_for_access_token(
 
     # Verify user exists and password is correct
     # Don't reveal which one failed (security best practice)
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await password_pool.run(
+        verify_password, form_data.password, user.password_hash,
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -93,13 +133,15 @@ async def login_for_access_token(
 
 
 @router.get("/me", response_model=UserPrivate)
+@query_budget(1)
 async def get_current_user(current_user:CurrentUser):
     """Get the currently authenticated user."""
     return current_user
 
 
 @router.get("/{user_id}", response_model=UserPublic)
-async def get_user(user_id: int, db: Annotated[AsyncSession, Depends(get_db)]):
+@query_budget(1)
+async def get_user(user_id: int, db: Annotated[AsyncSession, Depends(get_read_db)]):
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalars().first()
     if user:
@@ -108,22 +150,46 @@ async def get_user(user_id: int, db: Annotated[AsyncSession, Depends(get_db)]):
 
 
 @router.get("/{user_id}/posts", response_model=list[PostResponse])
-async def get_user_posts(user_id: int, db: Annotated[AsyncSession, Depends(get_db)]):
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
+@query_budget(3)
+async def get_user_posts(
+    user_id: int,
+    request: Request,
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+):
+    # Answer revalidations from the version columns alone
+    if "if-none-match" in request.headers:
+        result = await db.execute(
+            post_version_query()
+            .where(Post.user_id == user_id)
+            .order_by(Post.date_posted.desc(), Post.id.desc()),
         )
+        rows = result.all()
+        if rows:
+            etag, last_modified = make_validators("user_posts", rows, collection=True)
+            if is_not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+
     result = await db.execute(
-        select(Post)
-        .options(selectinload(Post.author))
+        post_rows_query()
         .where(Post.user_id == user_id)
-        .order_by(Post.date_posted.desc()),
+        .order_by(Post.date_posted.desc(), Post.id.desc()),
+    )
+    rows = result.all()
+    if not rows:
+        # Tell a user without posts apart from one that does not exist
+        exists = await db.scalar(select(User.id).where(User.id == user_id))
+        if exists is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found",
+            )
+    etag, last_modified = make_validators(
+        "user_posts", [post_row_versions(row) for row in rows], collection=True,
+    )
+    return FastJSONResponse(
+        [post_row_to_dict(row) for row in rows],
+        headers=validator_headers(etag, last_modified),
     )
-    posts = result.scalars().all()
-    return posts
 
 
 @router.patch("/{user_id}", response_model=UserPrivate)
@@ -138,8 +204,7 @@ async def update_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorised to update this post",
         )    
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
+    user = await _fresh_user(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -183,6 +248,8 @@ async def update_user(
    
 
     await db.commit()
+    invalidate_user(user.id)
+    page_cache.invalidate(f"user:{user.id}")
     await db.refresh(user)
     return user
 
@@ -197,18 +264,23 @@ async def delete_user(user_id: int,
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorised to delete this post",
         )
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
-    if not user:
+    # One statement: the posts go with ON DELETE CASCADE in the database
+    result = await db.execute(
+        delete(User).where(User.id == user_id).returning(User.image_file, User.image_sizes),
+    )
+    row = result.first()
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
-    old_filename = user.image_file
-    await db.delete(user)
     await db.commit()
-    if old_filename:
-        delete_profile_image(old_filename)
+    invalidate_user(user_id)
+    page_cache.invalidate(f"user:{user_id}")
+    if row.image_file:
+        await job_queue.enqueue(
+            "delete_profile_image", filename=row.image_file, image_sizes=row.image_sizes,
+        )
 
 ## Upload Profile Picture Endpoint
 @router.patch("/{user_id}/picture", response_model=UserPrivate)
@@ -224,32 +296,71 @@ async def upload_profile_picture(
             detail="Not authorized to update this user's picture",
         )
 
-    content = await file.read()
-
-    if len(content) > settings.max_upload_size_bytes:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large. Maximum size is {settings.max_upload_size_bytes // (1024 * 1024)}MB",
-        )
+    # Walk the upload in chunks so memory stays at one chunk: check the
+    # image signature on the first chunk, stop as soon as the size limit is
+    # crossed, and copy it to a temp file that the image worker opens by path.
+    fd, spool_name = tempfile.mkstemp(prefix="upload-")
+    spool_path = Path(spool_name)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            size = 0
+            while chunk := await file.read(settings.upload_chunk_size_bytes):
+                if size == 0 and sniff_image_type(chunk) is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=INVALID_IMAGE_DETAIL,
+                    )
+                size += len(chunk)
+                if size > settings.max_upload_size_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                        detail=f"File too large. Maximum size is {settings.max_upload_size_bytes // (1024 * 1024)}MB",
+                    )
+                await run_in_threadpool(spool.write, chunk)
+        if size == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=INVALID_IMAGE_DETAIL,
+            )
+    except BaseException:
+        spool_path.unlink(missing_ok=True)
+        raise
 
+    # From here the engine removes the spool file, once its worker is done
+    # with it
     try:
-        new_filename = await run_in_threadpool(process_profile_image, content)
+        new_filename, new_sizes = await image_engine.process(spool_path, delete_source=True)
     except UnidentifiedImageError as err:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid image file. Please upload a valid image (JPEG, PNG, GIF, WebP).",
+            detail=INVALID_IMAGE_DETAIL,
         ) from err
 
-    old_filename = current_user.image_file
+    user = await _fresh_user(db, user_id)
+    if not user:
+        await job_queue.enqueue(
+            "delete_profile_image", filename=new_filename, image_sizes=new_sizes,
+        )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found",
+        )
+    old_filename = user.image_file
+    old_sizes = user.image_sizes
 
-    current_user.image_file = new_filename
+    user.image_file = new_filename
+    user.image_sizes = new_sizes
     await db.commit()
-    await db.refresh(current_user)
+    invalidate_user(user.id)
+    page_cache.invalidate(f"user:{user.id}")
+    await db.refresh(user)
 
     if old_filename:
-        delete_profile_image(old_filename)
+        await job_queue.enqueue(
+            "delete_profile_image", filename=old_filename, image_sizes=old_sizes,
+        )
 
-    return current_user
+    return user
 
 ## Delete Profile Picture Endpoint
 @router.delete("/{user_id}/picture", response_model=UserPrivate)
@@ -264,7 +375,14 @@ async def delete_user_picture(
             detail="Not authorized to delete this user's picture",
         )
 
-    old_filename = current_user.image_file
+    user = await _fresh_user(db, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found",
+        )
+    old_filename = user.image_file
+    old_sizes = user.image_sizes
 
     if old_filename is None:
         raise HTTPException(
@@ -272,10 +390,15 @@ async def delete_user_picture(
             detail="No profile picture to delete",
         )
 
-    current_user.image_file = None
+    user.image_file = None
+    user.image_sizes = None
     await db.commit()
-    await db.refresh(current_user)
+    invalidate_user(user.id)
+    page_cache.invalidate(f"user:{user.id}")
+    await db.refresh(user)
 
-    delete_profile_image(old_filename)
+    await job_queue.enqueue(
+        "delete_profile_image", filename=old_filename, image_sizes=old_sizes,
+    )
 
-    return current_user
\ No newline at end of file
+    return user
\ No newline at end of file
@@ -19,6 +19,7 @@ class UserPublic(BaseModel):
     username: str
     image_file: str | None
     image_path: str
+    image_srcset: str | None
 
 
 class UserPrivate(UserPublic):
@@ -56,4 +57,9 @@ class PostResponse(PostBase):
     id: int
     user_id: int
     date_posted: datetime
-    author: UserPublic
\ No newline at end of file
+    author: UserPublic
+
+
+class PostPage(BaseModel):
+    posts: list[PostResponse]
+    next_cursor: str | None
@@ -0,0 +1,118 @@
+import re
+
+from fastapi import HTTPException, status
+from sqlalchemy import (
+    Float,
+    Row,
+    Select,
+    and_,
+    column,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    table,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, REAL
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Post
+from pagination import pack_cursor, unpack_cursor
+from serializers import post_rows_query
+
+# Title matches count for more than content matches on both engines
+# (setweight 'A'/'B' on Postgres, bm25 column weights on SQLite).
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+WORD_PATTERN = re.compile(r"\w+")
+
+posts_fts = table("posts_fts", column("rowid"))
+
+
+## Search Queries
+# Each engine supplies the matching post ids and a rank where higher is more
+# relevant; the indexes are defined with the models. A page of ids is ranked
+# and cut first, and only that page is joined to posts and users.
+def _postgres_matches(q: str) -> tuple[Select, object, object]:
+    # Same configuration as the generated column, or the GIN index is not used
+    tsquery = func.websearch_to_tsquery(literal_column("'english'::regconfig"), q)
+    search_vector = literal_column("posts.search_vector")
+    # Weights for the D, C, B (content) and A (title) labels
+    weights = literal([0.1, 0.2, CONTENT_WEIGHT / TITLE_WEIGHT, 1.0], ARRAY(REAL))
+    rank = func.ts_rank_cd(weights, search_vector, tsquery, type_=Float)
+    query = select(Post.id, rank.label("rank")).where(search_vector.op("@@")(tsquery))
+    return query, Post.id, rank
+
+
+def _sqlite_matches(q: str) -> tuple[Select, object, object]:
+    # FTS5 has its own query syntax; quote every word so user input is
+    # always taken literally (all words must match, as on Postgres)
+    words = WORD_PATTERN.findall(q)
+    match = " ".join(f'"{word}"' for word in words)
+    fts_column = literal_column("posts_fts")
+    # bm25() is lower-is-better, so flip the sign
+    rank = -func.bm25(fts_column, TITLE_WEIGHT, CONTENT_WEIGHT, type_=Float)
+    query = (
+        select(posts_fts.c.rowid.label("id"), rank.label("rank"))
+        .where(fts_column.op("MATCH")(match))
+    )
+    return query, posts_fts.c.rowid, rank
+
+
+def search_matches(dialect_name: str, q: str) -> tuple[Select, object, object]:
+    """(query selecting id and rank, id column, rank expression) for q."""
+    if dialect_name == "postgresql":
+        return _postgres_matches(q)
+    return _sqlite_matches(q)
+
+
+## Ranked Pagination
+# Results are ordered by (rank desc, id desc); the cursor is that pair for
+# the last row, so later pages continue without OFFSET.
+def _decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    payload = unpack_cursor(cursor)
+    try:
+        return float(payload["r"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError) as err:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        ) from err
+
+
+async def search_posts(
+    db: AsyncSession,
+    q: str,
+    cursor: str | None,
+    limit: int,
+) -> tuple[list[Row], str | None]:
+    """One page of posts matching q, most relevant first, and the next cursor."""
+    if not WORD_PATTERN.search(q):
+        return [], None
+
+    matches, id_column, rank = search_matches(db.bind.dialect.name, q)
+    if cursor:
+        last_rank, last_id = _decode_rank_cursor(cursor)
+        matches = matches.where(
+            or_(rank < last_rank, and_(rank == last_rank, id_column < last_id)),
+        )
+    page = (
+        matches.order_by(rank.desc(), id_column.desc())
+        .limit(limit + 1)
+        .subquery()
+    )
+    query = (
+        post_rows_query()
+        .add_columns(page.c.rank)
+        .join(page, page.c.id == Post.id)
+        .order_by(page.c.rank.desc(), Post.id.desc())
+    )
+
+    result = await db.execute(query)
+    rows = list(result.all())
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, pack_cursor({"r": rows[-1].rank, "id": rows[-1].id})
+    return rows, None
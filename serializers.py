@@ -0,0 +1,68 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from sqlalchemy import Row, Select, select
+
+from models import Post, User, profile_image_path, profile_image_srcset
+
+
+## Fast JSON Responses
+def dumps(content: Any) -> bytes:
+    # OPT_UTC_Z writes UTC as "Z", as Pydantic does
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response for plain dicts and lists that skips response_model
+    validation. Only return data that already has the documented shape.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+## Post Projection
+# The columns PostResponse needs plus the version columns for ETags, read as
+# plain rows instead of hydrating Post and User objects.
+def post_rows_query() -> Select:
+    return select(
+        Post.id,
+        Post.title,
+        Post.content,
+        Post.user_id,
+        Post.date_posted,
+        Post.version,
+        Post.updated_at,
+        User.username,
+        User.image_file,
+        User.image_sizes,
+        User.version.label("author_version"),
+        User.updated_at.label("author_updated_at"),
+    ).join(Post.author)
+
+
+def post_row_versions(row: Row) -> tuple:
+    """The etags.post_version_query() row for a post_rows_query() row."""
+    return (
+        row.id, row.version, row.updated_at,
+        row.user_id, row.author_version, row.author_updated_at,
+    )
+
+
+def post_row_to_dict(row: Row) -> dict:
+    """A post_rows_query() row in the PostResponse JSON shape."""
+    return {
+        "title": row.title,
+        "content": row.content,
+        "id": row.id,
+        "user_id": row.user_id,
+        "date_posted": row.date_posted,
+        "author": {
+            "id": row.user_id,
+            "username": row.username,
+            "image_file": row.image_file,
+            "image_path": profile_image_path(row.image_file),
+            "image_srcset": profile_image_srcset(row.image_file, row.image_sizes, "webp"),
+        },
+    }
@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import json
+import logging
+import logging.handlers
+from datetime import UTC, datetime
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import metrics
+from cache import TTLCache
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_PREFIXES = {
+    "postgresql": "EXPLAIN ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def redact(parameters) -> object:
+    """Keep the shape of bound parameters, but not text or binary values."""
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    if parameters is None or isinstance(parameters, (bool, int, float)):
+        return parameters
+    if isinstance(parameters, (str, bytes)):
+        return f"<{type(parameters).__name__}, {len(parameters)}>"
+    return f"<{type(parameters).__name__}>"
+
+
+## Slow Query Log
+class SlowQueryLog:
+    """Keep statements slower than ``threshold_seconds`` in a rotating JSON-lines file.
+
+    Each entry has the SQL, redacted parameters, the route that ran it and
+    the plan from EXPLAIN (never EXPLAIN ANALYZE, so nothing runs twice).
+    The plan is fetched afterwards on a separate connection, at most
+    ``max_pending_explains`` at a time and once per statement per
+    ``explain_ttl_seconds``; later hits of the same statement reuse it.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        threshold_seconds: float | None,
+        max_bytes: int = 5 * 1024 * 1024,
+        backup_count: int = 3,
+        explain: bool = True,
+        max_pending_explains: int = 4,
+        explain_ttl_seconds: float = 300,
+    ):
+        self.path = Path(path)
+        self.threshold_seconds = threshold_seconds
+        self.explain = explain
+        self.max_pending_explains = max_pending_explains
+        self._plans = TTLCache(maxsize=256, ttl_seconds=explain_ttl_seconds)
+        self._pending: set[asyncio.Task] = set()
+        self._handler = logging.handlers.RotatingFileHandler(
+            self.path,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding="utf-8",
+            delay=True,
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self.recorded = 0
+
+    def is_slow(self, seconds: float) -> bool:
+        return self.threshold_seconds is not None and seconds >= self.threshold_seconds
+
+    def record(
+        self,
+        async_engine: AsyncEngine,
+        statement: str,
+        parameters,
+        seconds: float,
+        executemany: bool,
+    ) -> None:
+        """Called from the engine's after_cursor_execute hook, on the event loop thread."""
+        stats = metrics.current_request.get()
+        entry = {
+            "recorded_at": datetime.now(UTC).isoformat(),
+            "duration_ms": round(seconds * 1000, 3),
+            "route": stats.route if stats is not None else "background",
+            "dialect": async_engine.dialect.name,
+            "statement": statement,
+            "parameters": redact(parameters),
+            "executemany": executemany,
+            "plan": self._plans.get(statement),
+        }
+        logger.warning("Slow query (%.0f ms) on %s", seconds * 1000, entry["route"])
+
+        if (
+            entry["plan"] is None
+            and self.explain
+            and not executemany
+            and statement.lstrip()[:6].upper().startswith(EXPLAINABLE)
+            and len(self._pending) < self.max_pending_explains
+        ):
+            # An empty context, so the EXPLAIN is not counted against the request
+            task = asyncio.get_running_loop().create_task(
+                self._explain_and_write(async_engine, entry, parameters),
+                context=contextvars.Context(),
+            )
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        else:
+            self._write(entry)
+
+    async def _explain_and_write(self, async_engine: AsyncEngine, entry: dict, parameters) -> None:
+        prefix = EXPLAIN_PREFIXES.get(entry["dialect"], "EXPLAIN ")
+        try:
+            async with async_engine.connect() as conn:
+                result = await conn.exec_driver_sql(
+                    prefix + entry["statement"],
+                    parameters,
+                    execution_options={"slow_query_explain": True},
+                )
+                rows = result.all()
+            # One line per row: "QUERY PLAN" on Postgres, "id|parent|notused|detail" on SQLite
+            entry["plan"] = "\n".join(str(row[-1]) for row in rows)
+            self._plans.set(entry["statement"], entry["plan"])
+        except Exception as err:  # the plan is best effort; keep the entry
+            entry["plan_error"] = f"{type(err).__name__}: {err}"
+        self._write(entry)
+
+    def _write(self, entry: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._handler.handle(logging.makeLogRecord({"msg": json.dumps(entry, default=str)}))
+        self.recorded += 1
+
+    async def drain(self) -> None:
+        """Wait for pending EXPLAINs; for shutdown and tests."""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def recent(self, limit: int) -> list[dict]:
+        """Newest entries first, across the current file and its backups."""
+        entries = []
+        files = [self.path, *(
+            self.path.with_name(f"{self.path.name}.{number}")
+            for number in range(1, self._handler.backupCount + 1)
+        )]
+        for file in files:
+            if not file.exists():
+                continue
+            lines = file.read_text(encoding="utf-8").splitlines()
+            for line in reversed(lines):
+                entries.append(json.loads(line))
+                if len(entries) >= limit:
+                    return entries
+        return entries
+
+    def close(self) -> None:
+        self._handler.close()
+
+
+slow_query_log = SlowQueryLog(
+    path=Path(settings.slow_query_log_path),
+    threshold_seconds=settings.slow_query_threshold_seconds,
+    max_bytes=settings.slow_query_log_max_bytes,
+    backup_count=settings.slow_query_log_backups,
+    explain=settings.slow_query_explain,
+)
+
@@ -0,0 +1,103 @@
+import asyncio
+from collections.abc import AsyncIterator, Callable, Mapping
+from typing import Any
+
+import jinja2
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.templating import Jinja2Templates
+
+_DONE = object()
+# Rendered chunks waiting to be sent; past this, rendering (and with it the
+# database cursor) waits for the client to catch up
+MAX_QUEUED_CHUNKS = 64
+
+
+## Streamed Rendering
+# Jinja renders the template in a task of its own and this side sends
+# whatever is ready each time rendering has to wait, i.e. on the database.
+# The layout's head and navigation go out before the first row is fetched,
+# and articles follow batch by batch, instead of the whole page being built
+# as one string first.
+async def render_chunks(template: jinja2.Template, context: dict[str, Any]) -> AsyncIterator[bytes]:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_CHUNKS)
+
+    async def produce() -> None:
+        try:
+            async for chunk in template.generate_async(context):
+                await queue.put(chunk)
+        except Exception as err:  # re-raised on the sending side
+            await queue.put(err)
+        await queue.put(_DONE)
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            chunks = [await queue.get()]
+            while not queue.empty():
+                chunks.append(queue.get_nowait())
+            done = chunks[-1] is _DONE
+            if done:
+                chunks.pop()
+            if chunks and isinstance(chunks[-1], Exception):
+                raise chunks[-1]
+            if chunks:
+                yield "".join(chunks).encode()
+            if done:
+                return
+    finally:
+        # The client went away or rendering failed: stop rendering too
+        task.cancel()
+
+
+class StreamingTemplates(Jinja2Templates):
+    """Jinja2Templates whose TemplateResponse streams the page as it renders.
+
+    Templates may loop over async iterables (see pagination.PostStream),
+    which the async environment awaits row by row.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__(
+            env=jinja2.Environment(
+                loader=jinja2.FileSystemLoader(directory),
+                autoescape=jinja2.select_autoescape(),
+                enable_async=True,
+            ),
+        )
+
+    def TemplateResponse(  # pylint: disable=arguments-differ
+        self,
+        request: Request,
+        name: str,
+        context: dict[str, Any] | None = None,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        on_complete: Callable[[bytes], None] | None = None,
+        on_complete_max_bytes: int | None = None,
+    ) -> StreamingResponse:
+        """``on_complete`` gets the whole body once it has been sent, e.g. to cache it.
+
+        Bodies larger than ``on_complete_max_bytes`` are not kept, and
+        ``on_complete`` is not called for them.
+        """
+        context = {**(context or {}), "request": request}
+        template = self.get_template(name)
+
+        async def body() -> AsyncIterator[bytes]:
+            sent = [] if on_complete is not None else None
+            size = 0
+            async for chunk in render_chunks(template, context):
+                if sent is not None:
+                    size += len(chunk)
+                    if on_complete_max_bytes is not None and size > on_complete_max_bytes:
+                        sent = None
+                    else:
+                        sent.append(chunk)
+                yield chunk
+            if sent is not None:
+                on_complete(b"".join(sent))
+
+        return StreamingResponse(
+            body(), status_code=status_code, headers=headers, media_type="text/html",
+        )
@@ -0,0 +1,63 @@
+import pytest
+
+from assets import IMMUTABLE_CACHE_CONTROL, accepted_encodings, asset_manifest
+
+
+# ---------------------------------------------------
+# Test: Pages link fingerprinted assets
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_layout_uses_hashed_asset_urls(client):
+    """
+    Stylesheets and scripts are referenced by content-hashed
+    names from the manifest.
+    """
+    response = await client.get("/login")
+    hashed_css = asset_manifest.hashed("css/main.css")
+
+    assert hashed_css != "css/main.css"
+    assert f"/static/{hashed_css}" in response.text
+    assert f"/static/{asset_manifest.hashed('js/utils.js')}" in response.text
+
+
+# ---------------------------------------------------
+# Test: Precompressed bodies are negotiated
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_hashed_assets_are_immutable_and_precompressed(client):
+    """
+    Hashed URLs are cached forever and served with the best
+    encoding the client accepts; plain names keep working.
+    """
+    url = f"/static/{asset_manifest.hashed('css/main.css')}"
+
+    gzipped = await client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert gzipped.status_code == 200
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert gzipped.headers["vary"] == "Accept-Encoding"
+
+    identity = await client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    # httpx decodes gzip, so both bodies are the original stylesheet
+    assert gzipped.content == identity.content
+
+    brotli = await client.get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert brotli.headers["content-encoding"] == "br"
+    assert brotli.content == identity.content
+
+    not_modified = await client.get(
+        url,
+        headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]},
+    )
+    assert not_modified.status_code == 304
+
+    plain = await client.get("/static/css/main.css")
+    assert plain.status_code == 200
+    assert "immutable" not in plain.headers.get("cache-control", "")
+
+
+def test_accepted_encodings_respects_q_values():
+    assert accepted_encodings("gzip, deflate, br;q=0") == {"gzip", "deflate"}
+    assert accepted_encodings("br;q=0.5, gzip;q=1.0") == {"br", "gzip"}
+    assert accepted_encodings("") == set()
@@ -1,11 +1,20 @@
 import asyncio
+import os
+import tempfile
 import pytest_asyncio
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.pool import NullPool
 from httpx import ASGITransport
+# Keep queued jobs out of the development jobs.db and the working tree
+os.environ.setdefault(
+    "JOB_QUEUE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='blog-tests-'), 'jobs.db')}",
+)
+# Requests over their @query_budget fail the test instead of logging a warning
+os.environ.setdefault("QUERY_BUDGET_STRICT", "true")
 from main import app
-from database import Base, get_db
+from database import Base, enable_sqlite_foreign_keys, get_db, get_read_db, instrument_engine
 
 
 # ---------------------------------------
@@ -53,6 +62,8 @@ engine = create_async_engine(
     TEST_DATABASE_URL,
     poolclass=NullPool,
 )
+enable_sqlite_foreign_keys(engine)
+instrument_engine(engine)
 
 # Create session factory for test database
 TestingSessionLocal = async_sessionmaker(
@@ -87,6 +98,7 @@ async def override_get_db():
 
 # Tell FastAPI to use test DB instead of production DB
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 
 # ---------------------------------------------------
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool, StaticPool
+
+from cache import page_cache
+from database import Base, _engine_options, get_read_db, pool_stats, read_router
+from main import app
+from models import Post, User
+
+
+# ---------------------------------------------------
+# Fixture: two SQLite files standing in for primary and replica
+# ---------------------------------------------------
+@pytest_asyncio.fixture
+async def primary_and_replica(tmp_path, monkeypatch):
+    sessionmakers = {}
+    engines = []
+    for name in ("primary", "replica"):
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / name}.db",
+            poolclass=NullPool,
+        )
+        engines.append(engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessionmakers[name] = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with sessionmakers[name]() as session:
+            user = User(username=name, email=f"{name}@example.com", password_hash="x")
+            session.add(user)
+            await session.flush()
+            session.add(Post(title=f"{name} post", content="Body", user_id=user.id))
+            await session.commit()
+
+    monkeypatch.setattr(read_router, "primary", sessionmakers["primary"])
+    monkeypatch.setattr(read_router, "replicas", [sessionmakers["replica"]])
+    # Use the real read routing rather than the test database override
+    override = app.dependency_overrides.pop(get_read_db)
+
+    yield
+
+    app.dependency_overrides[get_read_db] = override
+    for engine in engines:
+        await engine.dispose()
+
+
+# ---------------------------------------------------
+# Test: Reads use the replica until the client writes
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_reads_follow_replica_then_primary_after_write(client, primary_and_replica):
+    response = await client.get("/api/posts")
+    assert [post["title"] for post in response.json()["posts"]] == ["replica post"]
+
+    # Any successful write puts this client on the primary for a while
+    write = await client.post(
+        "/api/users",
+        json={
+            "username": "replicawriter",
+            "email": "replicawriter@example.com",
+            "password": "password123",
+        },
+    )
+    assert write.status_code == 201
+    assert read_router.cookie_name in write.cookies
+
+    response = await client.get("/api/posts")
+    assert [post["title"] for post in response.json()["posts"]] == ["primary post"]
+
+
+# ---------------------------------------------------
+# Test: A client that wrote recently skips the page cache
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_recent_writer_skips_page_cache(client, primary_and_replica):
+    # As cached by this or another worker before the client's write
+    key = ("home", "http://test/", None)
+    page_cache.set(key, ('"stale"', None, b"stale page"))
+    try:
+        assert (await client.get("/")).text == "stale page"
+
+        client.cookies.set(read_router.cookie_name, str(time.time() + 60))
+        response = await client.get("/")
+        assert response.status_code == 200
+        assert "primary post" in response.text
+    finally:
+        page_cache.delete(key)
+
+
+# ---------------------------------------------------
+# Test: SQLite keeps the pool its dialect picks
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_in_memory_sqlite_keeps_static_pool():
+    url = "sqlite+aiosqlite://"
+    engine = create_async_engine(url, **_engine_options(url))
+    try:
+        assert isinstance(engine.sync_engine.pool, StaticPool)
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE kept (id INTEGER)"))
+        # Same connection, so the table is still there
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("SELECT count(*) FROM kept"))).scalar() == 0
+        assert pool_stats(engine) == {"pool_class": "StaticPool"}
+    finally:
+        await engine.dispose()
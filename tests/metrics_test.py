@@ -0,0 +1,70 @@
+import pytest
+
+from metrics import Histogram
+
+
+def sample(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+# ---------------------------------------------------
+# Test: Requests are recorded by route template
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_metrics_report_routes_statements_and_hashing(client, auth_headers):
+    """
+    Latency, status and SQL statement counts are labelled with
+    the route template, not the raw path.
+    """
+    created = await client.post(
+        "/api/posts",
+        json={"title": "Metrics", "content": "Counted"},
+        headers=auth_headers,
+    )
+    post_id = created.json()["id"]
+    before = (await client.get("/metrics")).text
+    route = 'route="/api/posts/{post_id}"'
+
+    await client.get(f"/api/posts/{post_id}")
+    await client.get("/api/posts/999999")
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    for status in ("200", "404"):
+        key = f'http_requests_total{{method="GET",{route},status="{status}"}}'
+        assert sample(text, key) == sample(before, key) + 1
+    assert f"/api/posts/{post_id}" not in text
+
+    requests = f'http_request_duration_seconds_count{{method="GET",{route}}}'
+    assert sample(text, requests) == sample(before, requests) + 2
+    statements = f"db_statements_per_request_sum{{{route}}}"
+    assert sample(text, statements) >= sample(before, statements) + 2
+    assert sample(text, f"db_statement_duration_seconds_count{{{route}}}") > 0
+
+    # Registering and logging in hashed a password
+    assert sample(text, "password_hash_duration_seconds_count") >= 2
+    assert sample(text, 'db_pool_connections{engine="primary",state="pool_size"}') > 0
+    assert 'worker_pool_jobs{pool="images",state="queued"}' in text
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("job_seconds", "Job time.", ("kind",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.1, "a")
+    histogram.observe(5.0, "a")
+
+    assert histogram.render() == [
+        "# HELP job_seconds Job time.",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{kind="a",le="0.1"} 2',
+        'job_seconds_bucket{kind="a",le="1.0"} 2',
+        'job_seconds_bucket{kind="a",le="+Inf"} 3',
+        'job_seconds_sum{kind="a"} 5.15',
+        'job_seconds_count{kind="a"} 3',
+    ]
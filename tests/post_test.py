@@ -1,4 +1,11 @@
+import json
+
 import pytest
+from sqlalchemy import event
+
+from config import settings
+from conftest import engine
+from models import EXCERPT_LENGTH, make_excerpt
 
 
 @pytest.mark.asyncio
@@ -21,7 +28,49 @@ async def test_get_posts(client):
     response = await client.get("/api/posts")
 
     assert response.status_code == 200
-    assert isinstance(response.json(), list)
+    assert isinstance(response.json()["posts"], list)
+    assert "next_cursor" in response.json()
+
+
+@pytest.mark.asyncio
+async def test_get_posts_cursor_pagination(client, auth_headers):
+    created_ids = []
+    for i in range(3):
+        create = await client.post(
+            "/api/posts",
+            json={"title": f"Page {i}", "content": "Paged content"},
+            headers=auth_headers,
+        )
+        created_ids.append(create.json()["id"])
+
+    # Walk every page; posts created in the same second are ordered by id
+    seen_ids = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/api/posts", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["posts"]) <= 2
+        page_ids = [post["id"] for post in page["posts"]]
+        assert not set(page_ids) & set(seen_ids)
+        seen_ids.extend(page_ids)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen_ids[:3] == created_ids[::-1]
+
+
+@pytest.mark.asyncio
+async def test_get_posts_rejects_bad_paging_params(client):
+    response = await client.get("/api/posts", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+    response = await client.get("/api/posts", params={"limit": 10_000})
+    assert response.status_code == 422
 
 
 @pytest.mark.asyncio
@@ -159,4 +208,324 @@ async def test_delete_post_success(client, auth_headers):
 
     # Confirm it no longer exists
     get_response = await client.get(f"/api/posts/{post_id}")
-    assert get_response.status_code == 404
\ No newline at end of file
+    assert get_response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_page_cache_serves_hits_and_invalidates(client, auth_headers):
+    create = await client.post(
+        "/api/posts",
+        json={"title": "Cached Title", "content": "Cached content"},
+        headers=auth_headers,
+    )
+    post_id = create.json()["id"]
+
+    first = await client.get(f"/posts/{post_id}")
+    assert "Cached Title" in first.text
+
+    statements = []
+
+    def record(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        second = await client.get(f"/posts/{post_id}")
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    assert second.text == first.text
+    assert statements == []
+
+    await client.patch(
+        f"/api/posts/{post_id}",
+        json={"title": "Edited Title"},
+        headers=auth_headers,
+    )
+    assert "Edited Title" in (await client.get(f"/posts/{post_id}")).text
+    assert "Edited Title" in (await client.get("/")).text
+
+
+@pytest.mark.asyncio
+async def test_get_post_conditional_requests(client, auth_headers):
+    create = await client.post(
+        "/api/posts",
+        json={"title": "Tagged", "content": "Tagged content"},
+        headers=auth_headers,
+    )
+    post_id = create.json()["id"]
+
+    first = await client.get(f"/api/posts/{post_id}")
+    etag = first.headers["ETag"]
+    assert "Last-Modified" in first.headers
+
+    not_modified = await client.get(
+        f"/api/posts/{post_id}", headers={"If-None-Match": etag},
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    since = await client.get(
+        f"/api/posts/{post_id}",
+        headers={"If-Modified-Since": first.headers["Last-Modified"]},
+    )
+    assert since.status_code == 304
+
+    await client.patch(
+        f"/api/posts/{post_id}",
+        json={"content": "Changed"},
+        headers=auth_headers,
+    )
+    changed = await client.get(
+        f"/api/posts/{post_id}", headers={"If-None-Match": etag},
+    )
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+    # HTML pages revalidate the same way
+    page = await client.get(f"/posts/{post_id}")
+    cached = await client.get(
+        f"/posts/{post_id}", headers={"If-None-Match": page.headers["ETag"]},
+    )
+    assert cached.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_list_revalidation_sees_deletes(client, auth_headers):
+    created = [
+        await client.post(
+            "/api/posts",
+            json={"title": f"Listed {number}", "content": "Body"},
+            headers=auth_headers,
+        )
+        for number in range(2)
+    ]
+    user_id = created[0].json()["user_id"]
+    urls = ["/", f"/users/{user_id}/posts", f"/api/users/{user_id}/posts"]
+    before = {url: await client.get(url) for url in urls}
+    for response in before.values():
+        assert "Last-Modified" not in response.headers
+
+    # Deleting the older post leaves the newest updated_at where it was
+    await client.delete(f"/api/posts/{created[0].json()['id']}", headers=auth_headers)
+    for url, response in before.items():
+        since = await client.get(
+            url, headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"},
+        )
+        assert since.status_code == 200
+        assert "Listed 0" not in since.text
+        stale = await client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+        assert stale.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_update_post_not_found(client, auth_headers):
+    response = await client.patch(
+        "/api/posts/9999",
+        json={"title": "Missing"},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Post not found"
+
+
+@pytest.mark.asyncio
+async def test_pool_stats(client):
+    response = await client.get("/health/pool")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert {"pool_size", "checked_out", "overflow", "wait_seconds_max"} <= stats.keys()
+
+
+@pytest.mark.asyncio
+async def test_list_endpoints_match_post_response(client, auth_headers):
+    """
+    The projected rows serialize exactly like PostResponse.
+    """
+    created = await client.post(
+        "/api/posts",
+        json={"title": "Projected", "content": "Same shape"},
+        headers=auth_headers,
+    )
+    post_id = created.json()["id"]
+    single = await client.get(f"/api/posts/{post_id}")
+
+    listed = await client.get("/api/posts", params={"limit": 50})
+    by_id = {post["id"]: post for post in listed.json()["posts"]}
+    assert by_id[post_id] == single.json()
+
+    user_posts = await client.get(f"/api/users/{created.json()['user_id']}/posts")
+    assert user_posts.json()[0] == single.json()
+    assert "etag" in user_posts.headers
+
+    missing = await client.get("/api/users/999999/posts")
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_export_posts_streams_ndjson(client, auth_headers, monkeypatch):
+    """
+    The export is one JSON object per line, fetched in batches,
+    and can be filtered by author and date range.
+    """
+    monkeypatch.setattr(settings, "export_batch_size", 2)
+    for i in range(3):
+        await client.post(
+            "/api/posts",
+            json={"title": f"Export {i}", "content": "Row"},
+            headers=auth_headers,
+        )
+    me = await client.get("/api/users/me", headers=auth_headers)
+    user_id = me.json()["id"]
+
+    response = await client.get("/api/posts/export", params={"user_id": user_id})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) >= 3
+    assert all(row["user_id"] == user_id for row in rows)
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+    assert {"Export 0", "Export 1", "Export 2"} <= {row["title"] for row in rows}
+
+    future = await client.get(
+        "/api/posts/export", params={"date_from": "2999-01-01T00:00:00"},
+    )
+    assert future.text == ""
+
+
+@pytest.mark.asyncio
+async def test_create_posts_bulk(client, auth_headers, monkeypatch):
+    """
+    A list of posts is created in one INSERT, returned in request
+    order, and the batch cap and per-post validation are enforced.
+    """
+    inserts = []
+
+    def count_inserts(_conn, _cursor, statement, *_args):
+        if statement.startswith("INSERT INTO posts"):
+            inserts.append(statement)
+
+    payload = [{"title": f"Bulk {i}", "content": f"Body {i}"} for i in range(5)]
+    event.listen(engine.sync_engine, "before_cursor_execute", count_inserts)
+    try:
+        response = await client.post("/api/posts/bulk", json=payload, headers=auth_headers)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count_inserts)
+
+    assert response.status_code == 201
+    created = response.json()
+    assert [post["title"] for post in created] == [post["title"] for post in payload]
+    assert all(post["author"]["username"] == "postuser" for post in created)
+    assert len(inserts) == 1
+
+    fetched = await client.get(f"/api/posts/{created[-1]['id']}")
+    assert fetched.json()["content"] == "Body 4"
+
+    invalid = await client.post(
+        "/api/posts/bulk",
+        json=[{"title": "Fine", "content": "Fine"}, {"title": "", "content": "No title"}],
+        headers=auth_headers,
+    )
+    assert invalid.status_code == 422
+
+    empty = await client.post("/api/posts/bulk", json=[], headers=auth_headers)
+    assert empty.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_search_posts_ranks_and_stays_in_sync(client, auth_headers):
+    """
+    Search finds stemmed words, ranks title matches first, pages
+    with a cursor and follows updates and deletes.
+    """
+    titles = ["Gardening basics", "Kitchen notes", "Weekend plans"]
+    contents = ["Soil and seeds", "Gardens need water", "Visit the gardener"]
+    created = []
+    for title, content in zip(titles, contents):
+        response = await client.post(
+            "/api/posts",
+            json={"title": title, "content": content},
+            headers=auth_headers,
+        )
+        created.append(response.json()["id"])
+
+    first = await client.get("/api/posts/search", params={"q": "garden", "limit": 2})
+    assert first.status_code == 200
+    page = first.json()
+    assert page["posts"][0]["title"] == "Gardening basics"
+    assert page["next_cursor"] is not None
+
+    second = await client.get(
+        "/api/posts/search",
+        params={"q": "garden", "limit": 2, "cursor": page["next_cursor"]},
+    )
+    found = [post["id"] for post in page["posts"] + second.json()["posts"]]
+    assert set(created) <= set(found)
+    assert len(found) == len(set(found))
+
+    await client.patch(
+        f"/api/posts/{created[1]}",
+        json={"content": "Nothing about plants"},
+        headers=auth_headers,
+    )
+    await client.delete(f"/api/posts/{created[2]}", headers=auth_headers)
+    after = await client.get("/api/posts/search", params={"q": "garden", "limit": 50})
+    remaining = {post["id"] for post in after.json()["posts"]}
+    assert created[0] in remaining
+    assert not {created[1], created[2]} & remaining
+
+    odd_input = await client.get("/api/posts/search", params={"q": 'garden" OR -'})
+    assert odd_input.status_code == 200
+    bad_cursor = await client.get("/api/posts/search", params={"q": "garden", "cursor": "nope"})
+    assert bad_cursor.status_code == 400
+
+
+# ---------------------------------------------------
+# Test: Listing pages show excerpts without reading content
+# ---------------------------------------------------
+def test_make_excerpt():
+    assert make_excerpt("Short\n\n  post") == "Short post"
+    excerpt = make_excerpt("word " * 100)
+    assert len(excerpt) <= EXCERPT_LENGTH + 1
+    assert excerpt.endswith("word…")
+
+
+@pytest.mark.asyncio
+async def test_listing_pages_render_excerpts(client, auth_headers):
+    body = "Opening line. " + "filler " * 60 + "closing sentence only on the post page"
+    create = await client.post(
+        "/api/posts",
+        json={"title": "Long Read", "content": body},
+        headers=auth_headers,
+    )
+    post_id = create.json()["id"]
+    user_id = create.json()["user_id"]
+
+    statements = []
+
+    def record(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        pages = [await client.get("/"), await client.get(f"/users/{user_id}/posts")]
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    for page in pages:
+        assert "Opening line." in page.text
+        assert "closing sentence" not in page.text
+    assert statements
+    assert not any("posts.content" in statement for statement in statements)
+
+    assert "closing sentence" in (await client.get(f"/posts/{post_id}")).text
+    assert (await client.get(f"/api/posts/{post_id}")).json()["content"] == body
+
+    await client.patch(
+        f"/api/posts/{post_id}",
+        json={"content": "Rewritten"},
+        headers=auth_headers,
+    )
+    assert "Rewritten" in (await client.get("/")).text
+    assert "Rewritten" in (await client.get(f"/users/{user_id}/posts")).text
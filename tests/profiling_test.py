@@ -0,0 +1,76 @@
+import json
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from main import app
+from profiling import ProfilingMiddleware, RequestProfiler
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    return RequestProfiler(tmp_path, token="profile-me", interval_seconds=0.001, max_kept=2)
+
+
+@pytest.fixture
+def profiled_client(profiler):
+    transport = ASGITransport(app=ProfilingMiddleware(app, profiler))
+    return AsyncClient(transport=transport, base_url="http://test")
+
+
+# ---------------------------------------------------
+# Test: Profiling is not installed unless configured
+# ---------------------------------------------------
+def test_profiling_middleware_is_off_by_default():
+    assert all(middleware.cls is not ProfilingMiddleware for middleware in app.user_middleware)
+
+
+# ---------------------------------------------------
+# Test: A request with the token is profiled
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_token_request_saves_stacks_and_sql_timeline(
+    client, auth_headers, profiled_client, profiler,
+):
+    created = await client.post(
+        "/api/posts",
+        json={"title": "Profiled", "content": "Body"},
+        headers=auth_headers,
+    )
+    post_id = created.json()["id"]
+
+    async with profiled_client:
+        plain = await profiled_client.get(f"/api/posts/{post_id}")
+        wrong = await profiled_client.get(
+            f"/api/posts/{post_id}", headers={"X-Profile-Token": "guess"},
+        )
+        response = await profiled_client.get(
+            f"/api/posts/{post_id}", headers={"X-Profile-Token": "profile-me"},
+        )
+
+    assert "x-profile-id" not in plain.headers
+    assert "x-profile-id" not in wrong.headers
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    details = json.loads((profiler.directory / f"{profile_id}.json").read_text())
+    assert details["route"] == "/api/posts/{post_id}"
+    assert details["status_code"] == 200
+    assert details["sql"]
+    assert all(entry["start_ms"] >= 0 for entry in details["sql"])
+    assert "FROM posts" in details["sql"][0]["statement"]
+
+    for line in (profiler.directory / f"{profile_id}.collapsed").read_text().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        assert stack
+
+
+@pytest.mark.asyncio
+async def test_old_profiles_are_rotated(profiled_client, profiler):
+    async with profiled_client:
+        for _ in range(3):
+            await profiled_client.get("/login", headers={"X-Profile-Token": "profile-me"})
+
+    assert len(list(profiler.directory.glob("*.json"))) == 2
+    assert len(list(profiler.directory.glob("*.collapsed"))) == 2
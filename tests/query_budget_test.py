@@ -0,0 +1,91 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from config import settings
+from metrics import RequestStats, StatementRecord
+from query_budget import QueryBudgetExceeded, check_query_budget, query_budget
+
+
+def stats_for(endpoint, statements: list[str]) -> RequestStats:
+    scope = {"path": "/api/things/1", "route": SimpleNamespace(path="/api/things/{id}", endpoint=endpoint)}
+    records = [StatementRecord(statement, 0.0, 0.001) for statement in statements]
+    return RequestStats(scope, statements=records)
+
+
+@query_budget(2)
+async def budgeted_endpoint():
+    pass
+
+
+# ---------------------------------------------------
+# Test: Listing pages stay within budget with many authors
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_listings_do_not_query_per_post(client, auth_headers):
+    """
+    The suite runs with QUERY_BUDGET_STRICT, so a request over
+    its budget raises; several authors would expose an N+1.
+    """
+    for number in range(3):
+        user = {
+            "username": f"budget{number}",
+            "email": f"budget{number}@example.com",
+            "password": "password123",
+        }
+        await client.post("/api/users", json=user)
+        login = await client.post(
+            "/api/users/token",
+            data={"username": user["email"], "password": user["password"]},
+        )
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        for post in range(3):
+            await client.post(
+                "/api/posts",
+                json={"title": f"Budget {number}.{post}", "content": "Body"},
+                headers=headers,
+            )
+
+    feed = await client.get("/api/posts", params={"limit": 50})
+    assert len(feed.json()["posts"]) >= 9
+    author_id = feed.json()["posts"][0]["user_id"]
+
+    for url in ("/", f"/users/{author_id}/posts", f"/api/users/{author_id}/posts"):
+        response = await client.get(url)
+        assert response.status_code == 200
+
+
+# ---------------------------------------------------
+# Test: Over-budget requests raise or log their statements
+# ---------------------------------------------------
+def test_over_budget_raises_when_strict(monkeypatch):
+    monkeypatch.setattr(settings, "query_budget_strict", True)
+    check_query_budget(stats_for(budgeted_endpoint, ["SELECT 1", "SELECT 2"]), "GET")
+
+    with pytest.raises(QueryBudgetExceeded, match="ran 3 SQL statements, budget is 2"):
+        check_query_budget(
+            stats_for(budgeted_endpoint, ["SELECT 1", "SELECT 2", "SELECT 3"]), "GET",
+        )
+
+
+def test_over_budget_logs_statements_in_production(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "query_budget_strict", False)
+    statements = ["SELECT posts.id\nFROM posts", "SELECT users.id FROM users WHERE users.id = ?"] * 2
+
+    with caplog.at_level(logging.WARNING, logger="query_budget"):
+        check_query_budget(stats_for(budgeted_endpoint, statements), "GET")
+
+    message = caplog.records[0].getMessage()
+    assert "GET /api/things/1 (/api/things/{id}) ran 4 SQL statements" in message
+    assert "  1. SELECT posts.id FROM posts" in message
+    assert "  4. SELECT users.id FROM users WHERE users.id = ?" in message
+
+
+def test_endpoints_without_budget_are_not_checked(monkeypatch):
+    monkeypatch.setattr(settings, "query_budget_strict", True)
+
+    async def unbudgeted():
+        pass
+
+    check_query_budget(stats_for(unbudgeted, ["SELECT 1"] * 100), "GET")
@@ -0,0 +1,78 @@
+import pytest
+import pytest_asyncio
+from pydantic import SecretStr
+
+import slow_queries
+from config import settings
+from slow_queries import SlowQueryLog, redact
+
+ADMIN_HEADERS = {"X-Admin-Token": "admin-secret"}
+
+
+@pytest_asyncio.fixture
+async def slow_log(tmp_path, monkeypatch):
+    # Record every statement
+    log = SlowQueryLog(tmp_path / "slow_queries.jsonl", threshold_seconds=0, max_bytes=4096)
+    monkeypatch.setattr(slow_queries, "slow_query_log", log)
+    monkeypatch.setattr(settings, "admin_token", SecretStr("admin-secret"))
+    yield log
+    await log.drain()
+    log.close()
+
+
+# ---------------------------------------------------
+# Test: Slow statements are stored with route and plan
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_slow_queries_record_route_plan_and_redacted_params(client, test_user, slow_log):
+    """
+    The stored plan shows whether the case-insensitive email
+    lookup at login uses the lower(email) index.
+    """
+    await client.post(
+        "/api/users/token",
+        data={"username": test_user["email"], "password": test_user["password"]},
+    )
+    await slow_log.drain()
+
+    response = await client.get("/api/admin/slow-queries", headers=ADMIN_HEADERS)
+    assert response.status_code == 200
+    assert response.json()["threshold_seconds"] == 0
+    queries = response.json()["queries"]
+
+    login = next(
+        entry for entry in queries
+        if entry["route"] == "/api/users/token" and "lower(users.email)" in entry["statement"]
+    )
+    assert login["dialect"] == "sqlite"
+    assert "USING INDEX ix_users_email_lower" in login["plan"]
+    assert login["parameters"][0] == f"<str, {len(test_user['email'])}>"
+    assert test_user["email"] not in response.text
+    # The EXPLAIN statements themselves are not recorded
+    assert not any(entry["statement"].startswith("EXPLAIN") for entry in queries)
+
+
+@pytest.mark.asyncio
+async def test_slow_query_endpoint_requires_admin_token(client, slow_log):
+    assert (await client.get("/api/admin/slow-queries")).status_code == 404
+    wrong = await client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "guess"})
+    assert wrong.status_code == 404
+    non_ascii = await client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "é".encode()})
+    assert non_ascii.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log_rotates(client, slow_log):
+    for _ in range(20):
+        await client.get("/api/posts")
+    await slow_log.drain()
+
+    assert slow_log.path.with_name("slow_queries.jsonl.1").exists()
+    entries = slow_log.recent(limit=500)
+    assert len(entries) > 1
+    assert entries[0]["recorded_at"] >= entries[-1]["recorded_at"]
+
+
+def test_redact_keeps_numbers_and_hides_text():
+    assert redact(("a@example.com", 5, None, b"xy")) == ["<str, 13>", 5, None, "<bytes, 2>"]
+    assert redact({"email": "secret"}) == {"email": "<str, 6>"}
@@ -0,0 +1,137 @@
+import asyncio
+import re
+
+import pytest
+from starlette.requests import Request
+
+import streaming
+from cache import page_cache
+from config import settings
+from main import app, streaming_templates
+from streaming import render_chunks
+
+
+# ---------------------------------------------------
+# Test: The layout is sent before the posts are fetched
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_layout_flushes_before_rows_arrive():
+    request = Request({
+        "type": "http",
+        "app": app,
+        "router": app.router,
+        "method": "GET",
+        "scheme": "http",
+        "server": ("test", 80),
+        "path": "/users/1/posts",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+    })
+    rows_wanted = asyncio.Event()
+
+    async def slow_posts():
+        rows_wanted.set()
+        await asyncio.Event().wait()  # a query that never returns
+        yield
+
+    template = streaming_templates.get_template("user_posts.html")
+    chunks = render_chunks(template, {"request": request, "user": {"username": "slow"}, "posts": slow_posts()})
+
+    first = (await asyncio.wait_for(anext(chunks), timeout=5)).decode()
+    assert rows_wanted.is_set()
+    assert "<head>" in first
+    assert "<nav" in first
+    assert "Posts by slow" in first
+    assert "</html>" not in first
+    await chunks.aclose()
+
+
+# ---------------------------------------------------
+# Test: Rendering waits for a slow client
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_rendering_waits_for_the_client():
+    rendered = 0
+
+    async def rows():
+        nonlocal rendered
+        for number in range(10_000):
+            rendered += 1
+            yield number
+
+    template = streaming_templates.env.from_string("{% for row in rows %}{{ row }},{% endfor %}")
+    chunks = render_chunks(template, {"rows": rows()})
+
+    await anext(chunks)
+    await asyncio.sleep(0.05)  # the client is not reading
+    assert rendered < 3 * streaming.MAX_QUEUED_CHUNKS
+    await chunks.aclose()
+
+
+# ---------------------------------------------------
+# Test: Streamed pages paginate, revalidate and cache
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_streamed_home_pages(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "posts_page_size", 2)
+    for number in range(3):
+        await client.post(
+            "/api/posts",
+            json={"title": f"Streamed {number}", "content": f"Body {number}"},
+            headers=auth_headers,
+        )
+
+    first = await client.get("/")
+    assert first.status_code == 200
+    assert first.headers["content-type"].startswith("text/html")
+    assert first.text.index("Streamed 2") < first.text.index("Streamed 1")
+    assert "Streamed 0" not in first.text
+    assert first.text.rstrip().endswith("</html>")
+
+    older = re.search(r'href="([^"]*\?cursor=[^"]+)">Older posts', first.text)
+    second = await client.get(older.group(1))
+    assert "Streamed 0" in second.text
+    assert "Streamed 1" not in second.text
+
+    etag = first.headers["etag"]
+    not_modified = await client.get("/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+
+    cached = await client.get("/")
+    assert cached.text == first.text
+    assert cached.headers["etag"] == etag
+
+
+@pytest.mark.asyncio
+async def test_streamed_user_posts_page(client, auth_headers):
+    created = await client.post(
+        "/api/posts",
+        json={"title": "By Author", "content": "Body"},
+        headers=auth_headers,
+    )
+    user_id = created.json()["user_id"]
+
+    page = await client.get(f"/users/{user_id}/posts")
+    assert page.status_code == 200
+    assert "By Author" in page.text
+    assert "etag" in page.headers
+
+
+@pytest.mark.asyncio
+async def test_large_streamed_pages_are_not_cached(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "page_cache_max_body_bytes", 1024)
+    created = await client.post(
+        "/api/posts",
+        json={"title": "Too Long To Cache", "content": "Body"},
+        headers=auth_headers,
+    )
+    user_id = created.json()["user_id"]
+
+    page = await client.get(f"/users/{user_id}/posts")
+    assert page.status_code == 200
+    assert "Too Long To Cache" in page.text
+    assert len(page.content) > 1024
+    assert not any(
+        key[0] == "user_posts" and key[2] == user_id for key in page_cache._data
+    )
@@ -1,4 +1,18 @@
+import asyncio
+import io
+import threading
+
 import pytest
+from fastapi import HTTPException
+from PIL import Image
+from sqlalchemy import event, update
+
+import image_utils
+from auth import PasswordHashPool, hash_password
+from config import settings
+from conftest import engine
+from jobs import JobQueue, job_queue
+from models import User
 
 
 # ---------------------------------------------------
@@ -223,4 +237,462 @@ async def test_delete_user_not_found(client):
     )
 
     assert response.status_code == 403
-    assert response.json()["detail"] == "Not authorised to delete this post"
\ No newline at end of file
+    assert response.json()["detail"] == "Not authorised to delete this post"
+
+# ---------------------------------------------------
+# Test: Password hash pool sheds load when full
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_password_pool_rejects_when_full():
+    """
+    Once every worker and queue slot is taken, further hashing
+    requests fail fast with 503 and a Retry-After header.
+    """
+    pool = PasswordHashPool(max_workers=1, max_queue=0, retry_after_seconds=3)
+    release = threading.Event()
+
+    busy = asyncio.create_task(pool.run(release.wait))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await pool.run(hash_password, "password123")
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "3"
+    assert pool.stats()["in_flight"] == 1
+    assert pool.stats()["rejected"] == 1
+
+    release.set()
+    await busy
+    assert pool.stats()["completed"] == 1
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_password_pool_counts_failures_and_holds_cancelled_slots():
+    """
+    Failed hashes are not counted as completed, and a cancelled caller
+    keeps its slot until the hash running for it has finished.
+    """
+    pool = PasswordHashPool(max_workers=1, max_queue=0, retry_after_seconds=3)
+
+    with pytest.raises(ZeroDivisionError):
+        await pool.run(lambda: 1 / 0)
+    assert pool.stats()["completed"] == 0
+    assert pool.stats()["failed"] == 1
+
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_hash():
+        started.set()
+        release.wait()
+
+    cancelled = asyncio.create_task(pool.run(slow_hash))
+    await asyncio.to_thread(started.wait)
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+    with pytest.raises(HTTPException):
+        await pool.run(hash_password, "password123")
+
+    release.set()
+    for _ in range(100):
+        if pool.stats()["in_flight"] == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert await pool.run(lambda: "ok") == "ok"
+    pool.shutdown()
+
+
+# ---------------------------------------------------
+# Test: Authenticated requests are served from the user cache
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_current_user_cached_and_invalidated(client):
+    """
+    Repeat calls to /me should not hit the database, and
+    updating the user must be visible immediately.
+    """
+    create = await client.post(
+        "/api/users",
+        json={
+            "username": "cacheuser",
+            "email": "cache@example.com",
+            "password": "password123",
+        },
+    )
+    user_id = create.json()["id"]
+
+    login = await client.post(
+        "/api/users/token",
+        data={"username": "cache@example.com", "password": "password123"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    await client.get("/api/users/me", headers=headers)
+
+    statements = []
+
+    def record(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = await client.get("/api/users/me", headers=headers)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert statements == []
+
+    await client.patch(
+        f"/api/users/{user_id}",
+        json={"username": "cacheuser2"},
+        headers=headers,
+    )
+    response = await client.get("/api/users/me", headers=headers)
+    assert response.json()["username"] == "cacheuser2"
+
+
+# ---------------------------------------------------
+# Test: Writes re-read the user instead of trusting the cache
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_user_writes_ignore_stale_cached_user(client, monkeypatch):
+    """
+    Another worker's write does not reach this worker's user cache, so
+    the write endpoints must act on the row as it is in the database.
+    """
+    create = await client.post(
+        "/api/users",
+        json={
+            "username": "staleuser",
+            "email": "stale@example.com",
+            "password": "password123",
+        },
+    )
+    user_id = create.json()["id"]
+    login = await client.post(
+        "/api/users/token",
+        data={"username": "stale@example.com", "password": "password123"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    await client.get("/api/users/me", headers=headers)
+
+    # As written by another worker: nothing here is invalidated
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(username="staleuser2", image_file="other_worker.jpg", image_sizes=[300]),
+        )
+    queued = []
+
+    async def enqueue(name, **kwargs):
+        queued.append((name, kwargs))
+
+    monkeypatch.setattr(job_queue, "enqueue", enqueue)
+
+    renamed = await client.patch(
+        f"/api/users/{user_id}",
+        json={"username": "staleuser2"},
+        headers=headers,
+    )
+    assert renamed.status_code == 200
+
+    deleted = await client.delete(f"/api/users/{user_id}/picture", headers=headers)
+    assert deleted.status_code == 200
+    assert deleted.json()["image_file"] is None
+    assert queued == [
+        ("delete_profile_image", {"filename": "other_worker.jpg", "image_sizes": [300]}),
+    ]
+
+
+# ---------------------------------------------------
+# Test: Deleting a user cascades to their posts
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_delete_user_cascades_posts(client):
+    """
+    The database removes a deleted user's posts via ON DELETE CASCADE.
+    """
+    create = await client.post(
+        "/api/users",
+        json={
+            "username": "cascadeuser",
+            "email": "cascade@example.com",
+            "password": "password123",
+        },
+    )
+    user_id = create.json()["id"]
+
+    login = await client.post(
+        "/api/users/token",
+        data={"username": "cascade@example.com", "password": "password123"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    post = await client.post(
+        "/api/posts",
+        json={"title": "Doomed", "content": "Goes with the user"},
+        headers=headers,
+    )
+    post_id = post.json()["id"]
+
+    response = await client.delete(f"/api/users/{user_id}", headers=headers)
+    assert response.status_code == 204
+
+    get_response = await client.get(f"/api/posts/{post_id}")
+    assert get_response.status_code == 404
+
+
+# ---------------------------------------------------
+# Test: Profile picture uploads are size and type checked
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_upload_picture_rejects_bad_files(client, auth_headers, monkeypatch):
+    """
+    Non-images fail on the signature check and oversized
+    uploads are refused with 413.
+    """
+    me = await client.get("/api/users/me", headers=auth_headers)
+    user_id = me.json()["id"]
+
+    response = await client.patch(
+        f"/api/users/{user_id}/picture",
+        files={"file": ("notes.txt", b"just some text", "text/plain")},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+
+    monkeypatch.setattr(settings, "max_upload_size_bytes", 1024)
+    monkeypatch.setattr(settings, "upload_chunk_size_bytes", 256)
+    too_big = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+    response = await client.patch(
+        f"/api/users/{user_id}/picture",
+        files={"file": ("big.jpg", too_big, "image/jpeg")},
+        headers=auth_headers,
+    )
+    assert response.status_code == 413
+
+
+# ---------------------------------------------------
+# Test: Uploads are stored at several sizes and formats
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_upload_picture_writes_variants(client, auth_headers, monkeypatch, tmp_path):
+    """
+    Every size is written as WebP and JPEG, exposed through
+    image_srcset, and all of them are removed with the picture.
+    """
+    monkeypatch.setattr(image_utils, "PROFILE_PICS_DIR", tmp_path)
+    me = await client.get("/api/users/me", headers=auth_headers)
+    user_id = me.json()["id"]
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), "teal").save(buffer, "PNG")
+    response = await client.patch(
+        f"/api/users/{user_id}/picture",
+        files={"file": ("avatar.png", buffer.getvalue(), "image/png")},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+
+    data = response.json()
+    stem = data["image_file"].rsplit("_", 1)[0]
+    assert data["image_file"] == f"{stem}_300.jpg"
+    assert data["image_srcset"] == ", ".join(
+        f"/media/profile_pics/{stem}_{size}.webp {size}w" for size in (64, 128, 300)
+    )
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        f"{stem}_{size}.{ext}" for size in (64, 128, 300) for ext in ("jpg", "webp")
+    )
+    with Image.open(tmp_path / f"{stem}_64.webp") as small:
+        assert small.size == (64, 64)
+
+    await client.post(
+        "/api/posts",
+        json={"title": "Hello", "content": "With a picture"},
+        headers=auth_headers,
+    )
+    home = await client.get("/")
+    assert f"/media/profile_pics/{stem}_128.webp 128w" in home.text
+    assert f"/media/profile_pics/{stem}_128.jpg 128w" in home.text
+
+    response = await client.delete(f"/api/users/{user_id}/picture", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["image_srcset"] is None
+    # The files are removed by a queued job, not on the request path
+    assert list(tmp_path.iterdir())
+    await job_queue.run_pending()
+    assert not list(tmp_path.iterdir())
+
+
+def test_delete_profile_image_removes_only_its_variants(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_utils, "PROFILE_PICS_DIR", tmp_path)
+    stem = "0123456789abcdef0123456789abcdef"
+    variants = [f"{stem}_{size}.{ext}" for size in (64, 300) for ext in ("webp", "jpg")]
+    others = ["my_photo.jpg", "my_other.png", f"{stem}_999.jpg"]
+    for name in [*variants, *others]:
+        (tmp_path / name).write_bytes(b"x")
+
+    image_utils.delete_profile_image("my_photo.jpg")
+    image_utils.delete_profile_image(f"{stem}_300.jpg", [64, 300])
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(others[1:])
+
+
+# ---------------------------------------------------
+# Test: Image engine processes in a worker and records timings
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_image_engine_processes_large_jpeg(tmp_path):
+    """
+    A large JPEG is decoded in draft mode in a worker process, and
+    the job shows up in the engine's timing stats.
+    """
+    pool = image_utils.ImageEngine(max_workers=1, max_queue=0, retry_after_seconds=2)
+    source = tmp_path / "upload.jpg"
+    Image.new("RGB", (4000, 3000), "navy").save(source, "JPEG")
+    output = tmp_path / "pics"
+
+    try:
+        filename, sizes = await pool.process(source, output)
+    finally:
+        pool.shutdown()
+
+    assert sizes == [64, 128, 300]
+    with Image.open(output / filename) as largest:
+        assert largest.size == (300, 300)
+
+    stats = pool.stats()
+    assert stats["completed"] == 1
+    assert stats["recent_work_seconds"]["p50"] > 0
+    assert stats["recent_total_seconds"]["max"] >= stats["recent_work_seconds"]["max"]
+
+
+@pytest.mark.asyncio
+async def test_image_engine_holds_cancelled_slots_and_cleans_up(tmp_path):
+    """
+    A cancelled upload keeps its slot while its worker is still resizing,
+    and the spool file and the variants it wrote are removed afterwards.
+    """
+    pool = image_utils.ImageEngine(max_workers=1, max_queue=0, retry_after_seconds=2)
+    warmup = tmp_path / "warmup.jpg"
+    Image.new("RGB", (64, 64), "navy").save(warmup, "JPEG")
+    source = tmp_path / "upload.png"
+    Image.new("RGB", (6000, 4000), "navy").save(source, "PNG")
+    output = tmp_path / "pics"
+
+    try:
+        kept, _ = await pool.process(warmup, output)
+        cancelled = asyncio.create_task(pool.process(source, output, delete_source=True))
+        await asyncio.sleep(0.2)  # handed to the worker, which takes ~0.5s
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+        with pytest.raises(HTTPException):
+            await pool.process(warmup, output)
+
+        for _ in range(500):
+            if pool.stats()["in_flight"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.stats()["in_flight"] == 0
+    finally:
+        pool.shutdown()
+
+    assert not source.exists()
+    stem = kept.split("_")[0]
+    assert all(path.name.startswith(stem) for path in output.iterdir())
+
+
+# ---------------------------------------------------
+# Test: Failed jobs are retried, then kept as failed
+# ---------------------------------------------------
+@pytest.mark.asyncio
+async def test_job_queue_retries_and_persists(tmp_path):
+    """
+    Jobs survive a new queue instance on the same file, failures
+    are retried after a backoff, and give up after max_attempts.
+    """
+    url = f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}"
+    calls = []
+
+    def flaky(name):
+        calls.append(name)
+        if len(calls) < 2:
+            raise OSError("disk busy")
+
+    queue = JobQueue(url, poll_interval_seconds=1, max_attempts=2, retry_base_seconds=0)
+    queue.register("flaky", flaky)
+    queue.register("broken", lambda: 1 / 0)
+    await queue.enqueue("flaky", name="a")
+    await queue.enqueue("broken")
+    await queue.engine.dispose()
+
+    # A fresh instance, as after a restart, picks the jobs up
+    queue = JobQueue(url, poll_interval_seconds=1, max_attempts=2, retry_base_seconds=0)
+    queue.register("flaky", flaky)
+    queue.register("broken", lambda: 1 / 0)
+    assert await queue.stats() == {"pending": 2}
+
+    await queue.run_pending()
+    assert calls == ["a", "a"]
+    assert await queue.stats() == {"failed": 1}
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_queue_leaves_leased_jobs_to_their_worker(tmp_path):
+    """
+    A queue starting up on a shared file does not take over a job another
+    worker is running, only one whose lease has expired, and only until
+    the job has used up its attempts.
+    """
+    url = f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}"
+    calls = []
+
+    def record(value):
+        calls.append(value)
+
+    queues = [
+        JobQueue(url, poll_interval_seconds=60, max_attempts=3, retry_base_seconds=0, lease_seconds=0.5)
+        for _ in range(2)
+    ]
+    for queue in queues:
+        queue.register("record", record)
+    running, starting = queues
+
+    await running.enqueue("record", value="a")
+    job = await running._claim()  # pylint: disable=protected-access
+    assert job.worker_id == running.worker_id
+
+    await starting.start()
+    assert await starting.run_pending() == 0
+    assert await starting.stats() == {"running": 1}
+
+    # The first worker died without renewing its lease
+    await asyncio.sleep(0.6)
+    assert await starting.run_pending() == 1
+    assert calls == ["a"]
+    assert await starting.stats() == {}
+
+    # A job whose worker dies on every attempt is given up, not re-run
+    await running.enqueue("record", value="b")
+    for attempt in range(1, 4):
+        job = await running._claim()  # pylint: disable=protected-access
+        assert job.attempts == attempt
+        await asyncio.sleep(0.6)  # and the worker died again
+    assert await starting.run_pending() == 0
+    assert calls == ["a"]
+    assert await starting.stats() == {"failed": 1}
+
+    for queue in queues:
+        await queue.stop()